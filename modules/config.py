@@ -1,18 +1,71 @@
 # Configuration storage for Something Remote
 # Stores WiFi and MQTT settings in NVS
 
-import json
+from micropython import const
+import struct
 
 # Power button mode constants
 POWER_MODE_HA = "ha"    # Send power command to Home Assistant
 POWER_MODE_BLE = "ble"  # Send BLE Consumer Control power command
 
+# Status prints are compiled out of frozen bytecode unless this is flipped
+# to 1 for a dev build. Failures are always printed.
+_DEBUG = const(0)
+
 try:
-    import esp32
+    import nvs_cache
     HAS_NVS = True
 except ImportError:
     HAS_NVS = False
 
+# Binary NVS blob layout (little-endian):
+#   B version, B flags, H mqtt_port, then each string in _STRING_FIELDS as
+#   B length + UTF-8 bytes. Legacy JSON blobs start with '{' (0x7B), which
+#   can never be a valid version byte, so they're detected and migrated.
+_BLOB_VERSION = const(1)
+_DEFAULT_MQTT_PORT = const(1883)
+_HEADER = "<BBH"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_STRING_FIELDS = (
+    "wifi_ssid", "wifi_password", "mqtt_host", "mqtt_user",
+    "mqtt_password", "device_name", "power_button_mode",
+)
+# Boolean settings, in flag bit order
+_FLAG_FIELDS = ("configured", "battery_enabled", "wake_counter_enabled")
+
+
+def _pack(cfg):
+    """Serialize a Config's settings into the binary blob layout."""
+    flags = 0
+    for bit, key in enumerate(_FLAG_FIELDS):
+        if getattr(cfg, key):
+            flags |= 1 << bit
+    data = bytearray(struct.pack(_HEADER, _BLOB_VERSION, flags, cfg.mqtt_port))
+    for key in _STRING_FIELDS:
+        raw = getattr(cfg, key).encode("utf-8")
+        if len(raw) > 255:
+            raise ValueError(key + " too long")
+        data.append(len(raw))
+        data.extend(raw)
+    return data
+
+
+def _unpack(data):
+    """Parse a binary blob back into a settings dict."""
+    version, flags, port = struct.unpack_from(_HEADER, data, 0)
+    if version != _BLOB_VERSION:
+        raise ValueError("unknown config version %d" % version)
+    cfg = {"mqtt_port": port}
+    for bit, key in enumerate(_FLAG_FIELDS):
+        cfg[key] = bool(flags & (1 << bit))
+    pos = _HEADER_SIZE
+    for key in _STRING_FIELDS:
+        n = data[pos]
+        # bytes() of a memoryview slice: the one copy needed to decode
+        cfg[key] = bytes(data[pos + 1:pos + 1 + n]).decode("utf-8")
+        pos += 1 + n
+    return cfg
+
 
 class Config:
     """Configuration storage using ESP32 NVS."""
@@ -24,7 +77,7 @@ class Config:
         "wifi_ssid": "",
         "wifi_password": "",
         "mqtt_host": "",
-        "mqtt_port": 1883,
+        "mqtt_port": _DEFAULT_MQTT_PORT,
         "mqtt_user": "",
         "mqtt_password": "",
         "device_name": "something_remote",
@@ -35,43 +88,77 @@ class Config:
     }
 
     def __init__(self):
-        self._config = dict(self.DEFAULTS)
+        self._apply(self.DEFAULTS)
         self._nvs = None
+        self._last_saved = None  # blob bytes last read from / written to NVS
         if HAS_NVS:
             try:
-                self._nvs = esp32.NVS(self.NAMESPACE)
+                self._nvs = nvs_cache.get(self.NAMESPACE)
             except Exception as e:
                 print("NVS init failed:", e)
 
+    def _apply(self, values):
+        """Copy known settings from a dict onto this instance."""
+        for key in self.DEFAULTS:
+            if key in values:
+                setattr(self, key, values[key])
+        self._refresh_configured()
+
+    def _refresh_configured(self):
+        # is_configured is read on every button/battery publish, so it's a
+        # plain attribute recomputed whenever the settings it depends on are
+        # loaded, set via set()/set_configured(), or saved.
+        self.is_configured = (
+            bool(self.configured) and self.wifi_ssid != "" and self.mqtt_host != ""
+        )
+
     def load(self):
         """Load configuration from NVS."""
         if not self._nvs:
             return False
 
         try:
-            data = bytearray(512)
-            num_bytes = self._nvs.get_blob("config", data)
+            data, num_bytes = nvs_cache.read_blob(self._nvs, "config")
             if num_bytes > 0:
-                loaded = json.loads(data[:num_bytes].decode('utf-8'))
-                self._config.update(loaded)
-                print("Config loaded")
+                if data[0] == 0x7B:  # '{' - legacy JSON blob
+                    import json
+                    self._apply(json.loads(data[:num_bytes].decode('utf-8')))
+                    if _DEBUG:
+                        print("Config loaded (legacy JSON), migrating")
+                    self.save()
+                else:
+                    # memoryview: parse in place, one copy for _last_saved
+                    blob = memoryview(data)[:num_bytes]
+                    self._apply(_unpack(blob))
+                    self._last_saved = bytes(blob)
+                    if _DEBUG:
+                        print("Config loaded")
                 return True
         except OSError:
-            print("No saved config")
+            if _DEBUG:
+                print("No saved config")
         except Exception as e:
             print("Config load failed:", e)
         return False
 
     def save(self):
-        """Save configuration to NVS."""
+        """Save configuration to NVS.
+
+        Skips the flash write entirely if nothing changed since the last
+        load/save."""
         if not self._nvs:
             return False
 
+        self._refresh_configured()
         try:
-            data = json.dumps(self._config)
+            data = bytes(_pack(self))
+            if data == self._last_saved:
+                return True
             self._nvs.set_blob("config", data)
             self._nvs.commit()
-            print("Config saved")
+            self._last_saved = data
+            if _DEBUG:
+                print("Config saved")
             return True
         except Exception as e:
             print("Config save failed:", e)
@@ -79,114 +166,33 @@ class Config:
 
     def clear(self):
         """Clear all configuration."""
-        self._config = dict(self.DEFAULTS)
+        self._apply(self.DEFAULTS)
+        self._last_saved = None
         if self._nvs:
             try:
                 self._nvs.erase_key("config")
                 self._nvs.commit()
-                print("Config cleared")
+                if _DEBUG:
+                    print("Config cleared")
             except Exception:
                 pass
 
     def get(self, key, default=None):
-        """Get a config value."""
-        return self._config.get(key, default)
+        """Get a config value, or default if key isn't a setting."""
+        if key not in self.DEFAULTS:
+            return default
+        return getattr(self, key)
 
     def set(self, key, value):
-        """Set a config value."""
-        self._config[key] = value
-
-    @property
-    def is_configured(self):
-        """Check if WiFi and MQTT are configured."""
-        return (
-            self._config.get("configured", False) and
-            self._config.get("wifi_ssid", "") != "" and
-            self._config.get("mqtt_host", "") != ""
-        )
-
-    @property
-    def wifi_ssid(self):
-        return self._config.get("wifi_ssid", "")
-
-    @wifi_ssid.setter
-    def wifi_ssid(self, value):
-        self._config["wifi_ssid"] = value
-
-    @property
-    def wifi_password(self):
-        return self._config.get("wifi_password", "")
-
-    @wifi_password.setter
-    def wifi_password(self, value):
-        self._config["wifi_password"] = value
-
-    @property
-    def mqtt_host(self):
-        return self._config.get("mqtt_host", "")
-
-    @mqtt_host.setter
-    def mqtt_host(self, value):
-        self._config["mqtt_host"] = value
-
-    @property
-    def mqtt_port(self):
-        return self._config.get("mqtt_port", 1883)
-
-    @mqtt_port.setter
-    def mqtt_port(self, value):
-        self._config["mqtt_port"] = value
-
-    @property
-    def mqtt_user(self):
-        return self._config.get("mqtt_user", "")
-
-    @mqtt_user.setter
-    def mqtt_user(self, value):
-        self._config["mqtt_user"] = value
-
-    @property
-    def mqtt_password(self):
-        return self._config.get("mqtt_password", "")
-
-    @mqtt_password.setter
-    def mqtt_password(self, value):
-        self._config["mqtt_password"] = value
-
-    @property
-    def device_name(self):
-        return self._config.get("device_name", "something_remote")
-
-    @device_name.setter
-    def device_name(self, value):
-        self._config["device_name"] = value
+        """Set a config value. Raises KeyError if key isn't a setting."""
+        if key not in self.DEFAULTS:
+            raise KeyError(key)
+        setattr(self, key, value)
+        self._refresh_configured()
 
     def set_configured(self, value=True):
-        self._config["configured"] = value
-
-    @property
-    def power_button_mode(self):
-        return self._config.get("power_button_mode", POWER_MODE_HA)
-
-    @power_button_mode.setter
-    def power_button_mode(self, value):
-        self._config["power_button_mode"] = value
-
-    @property
-    def battery_enabled(self):
-        return bool(self._config.get("battery_enabled", False))
-
-    @battery_enabled.setter
-    def battery_enabled(self, value):
-        self._config["battery_enabled"] = bool(value)
-
-    @property
-    def wake_counter_enabled(self):
-        return bool(self._config.get("wake_counter_enabled", False))
-
-    @wake_counter_enabled.setter
-    def wake_counter_enabled(self, value):
-        self._config["wake_counter_enabled"] = bool(value)
+        self.configured = value
+        self._refresh_configured()
 
 
 # Global config instance
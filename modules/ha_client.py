@@ -3,12 +3,10 @@
 # Public surface is deliberately synchronous (enqueue-and-return) so button
 # handlers on the main loop never block on the network.
 
+from micropython import const
 import time
 import json
-import ubinascii
-import machine
 import asyncio
-import network
 from config import config
 from logger import log
 
@@ -17,28 +15,68 @@ try:
 except ImportError:
     VERSION = "dev"
 
-from mqtt_as import MQTTClient, config as _mqtt_config
+_BATTERY_REPORT_INTERVAL_MS = const(600000)  # 10 min rate-limit for piggy-back publishes
+_OUTBOX_MAX = const(32)  # drop-oldest ceiling on pending publishes
+_PUBLISH_TIMEOUT_S = const(30)  # per-message timeout; mqtt_as internally retries within this
+_CONNECT_RETRY_S = const(5)  # first initial-connect retry delay, doubled per failure
+_CONNECT_RETRY_MAX_S = const(60)
+
+# HA-side buttons advertised as device triggers: (action id, display name)
+_HA_BUTTONS = (
+    ("power", "Power"),
+    ("shortcut_1", "Shortcut 1"),
+    ("shortcut_2", "Shortcut 2"),
+    ("shortcut_3", "Shortcut 3"),
+    ("shortcut_4", "Shortcut 4"),
+    ("brightness_up", "Brightness Up"),
+    ("brightness_down", "Brightness Down"),
+)
+
+# Battery sensor discovery: (subtopic, name, entity-specific fields)
+_BATTERY_SENSORS = (
+    ("battery", "Battery", {
+        "device_class": "battery",
+        "unit_of_measurement": "%",
+        "value_template": "{{ value_json.percent }}",
+    }),
+    ("voltage", "Battery Voltage", {
+        "device_class": "voltage",
+        "unit_of_measurement": "V",
+        "value_template": "{{ value_json.voltage }}",
+        "entity_category": "diagnostic",
+    }),
+    ("battery_raw_uv", "Battery ADC Raw", {
+        "unit_of_measurement": "uV",  # ASCII: the unit gets displayed as "μV"-free to avoid the len-mismatch bug
+        "value_template": "{{ value_json.raw_uv }}",
+        "entity_category": "diagnostic",
+    }),
+)
 
 
 class HomeAssistantClient:
     """MQTT client for Home Assistant with auto-discovery, backed by mqtt_as."""
 
-    BATTERY_REPORT_INTERVAL_MS = 10 * 60 * 1000  # 10 min rate-limit for piggy-back publishes
-    OUTBOX_MAX = 32  # drop-oldest ceiling on pending publishes
-    PUBLISH_TIMEOUT_S = 30  # per-message timeout; mqtt_as internally retries within this
-
     def __init__(self):
         self._device_id = self._get_device_id()
+        # State topics are fixed per device; pre-encode once so the button
+        # path doesn't format and encode a fresh str on every press.
+        self._topic_action = (self._device_id + "/action").encode()
+        self._topic_event = (self._device_id + "/event").encode()
+        self._topic_battery = (self._device_id + "/battery").encode()
         self._client = None
         self._outbox = None  # list of (topic, payload, retain); None until start()
         self._last_battery_report = 0
         self._worker_task = None
         self._watcher_task = None
+        self._connect_task = None
         self._started = False
+        self._discovery_cache = None  # list of (topic, payload bytes), built on first connect
 
     def _get_device_id(self):
-        mac = ubinascii.hexlify(machine.unique_id()).decode()
-        return f"something_remote_{mac[-6:]}"
+        import machine
+        mac = machine.unique_id()
+        # Low three MAC bytes, same id the old hexlify()[-6:] produced
+        return "something_remote_%02x%02x%02x" % (mac[-3], mac[-2], mac[-1])
 
     @property
     def device_name(self):
@@ -53,12 +91,16 @@ class HomeAssistantClient:
     async def start(self):
         """Initialise mqtt_as, spawn worker + watcher tasks, kick off connect.
 
-        Non-blocking in the sense that we don't wait for the broker to come up
-        before returning — we do give the initial connect a short head-start
-        so first-press latency is usually fine."""
+        Returns as soon as the outbox is ready; the WiFi + broker connect runs
+        as a background task so the main loop starts polling buttons straight
+        away. Anything enqueued before the broker is up drains once it lands.
+        mqtt_as (and the network stack it pulls in) is only imported here, so
+        wakes without HA configured never pay for it."""
         if self._started or not self.is_configured:
             return self._started
 
+        from mqtt_as import MQTTClient, config as _mqtt_config
+
         cfg = _mqtt_config.copy()
         cfg["server"] = config.mqtt_host
         cfg["port"] = config.mqtt_port
@@ -82,29 +124,7 @@ class HomeAssistantClient:
 
         self._worker_task = asyncio.create_task(self._publish_worker())
         self._watcher_task = asyncio.create_task(self._connection_watcher())
-
-        # Initial connect — give it up to 10s for a fast first publish. If it
-        # times out, mqtt_as continues retrying in the background; queued
-        # publishes will drain whenever it lands.
-        try:
-            log(f"MQTT starting: {config.mqtt_host}:{config.mqtt_port}")
-            await asyncio.wait_for(self._client.connect(quick=True), 10)
-        except asyncio.TimeoutError:
-            log("MQTT initial connect slow, continuing in background")
-        except Exception as e:
-            log(f"MQTT initial connect error: {e}")
-
-        # Disable WiFi modem sleep. With the default power-save, ESP32 sleeps
-        # the WiFi radio between AP beacons, occasionally dropping PINGRESP
-        # packets so mqtt_as decides the connection is dead and forces a
-        # reconnect every ~50s. Observed in broker log as a flap storm with
-        # "session taken over" reasons. PM_NONE trades ~10-20mA of extra
-        # current (only while we're awake) for a stable TCP connection.
-        try:
-            sta = network.WLAN(network.STA_IF)
-            sta.config(pm=sta.PM_NONE)
-        except Exception as e:
-            log(f"WiFi PM_NONE failed: {e}")
+        self._connect_task = asyncio.create_task(self._initial_connect())
         return True
 
     async def stop(self):
@@ -116,7 +136,7 @@ class HomeAssistantClient:
         """
         if not self._started:
             return
-        for task in (self._worker_task, self._watcher_task):
+        for task in (self._connect_task, self._worker_task, self._watcher_task):
             if task is None:
                 continue
             task.cancel()
@@ -133,6 +153,7 @@ class HomeAssistantClient:
                 self._client.close()
             except BaseException:
                 pass
+        self._connect_task = None
         self._worker_task = None
         self._watcher_task = None
         self._client = None
@@ -153,6 +174,37 @@ class HomeAssistantClient:
 
     # --- background tasks ---
 
+    async def _initial_connect(self):
+        """First WiFi + broker connect, retried with backoff until it succeeds.
+
+        mqtt_as only starts its own reconnect loop after the first successful
+        connect, so until then retrying is on us. The delay doubles up to
+        _CONNECT_RETRY_MAX_S so an unreachable broker doesn't bring WiFi up
+        every few seconds for the whole wake."""
+        log(f"MQTT starting: {config.mqtt_host}:{config.mqtt_port}")
+        delay = _CONNECT_RETRY_S
+        while True:
+            try:
+                await self._client.connect(quick=True)
+                break
+            except Exception as e:
+                log(f"MQTT initial connect error: {e}, retry in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _CONNECT_RETRY_MAX_S)
+
+        # Disable WiFi modem sleep. With the default power-save, ESP32 sleeps
+        # the WiFi radio between AP beacons, occasionally dropping PINGRESP
+        # packets so mqtt_as decides the connection is dead and forces a
+        # reconnect every ~50s. Observed in broker log as a flap storm with
+        # "session taken over" reasons. PM_NONE trades ~10-20mA of extra
+        # current (only while we're awake) for a stable TCP connection.
+        try:
+            import network
+            sta = network.WLAN(network.STA_IF)
+            sta.config(pm=sta.PM_NONE)
+        except Exception as e:
+            log(f"WiFi PM_NONE failed: {e}")
+
     async def _connection_watcher(self):
         """Re-send discovery on every (re)connect event. Spawns a down watcher."""
         asyncio.create_task(self._down_watcher())
@@ -184,7 +236,7 @@ class HomeAssistantClient:
             try:
                 await asyncio.wait_for(
                     self._client.publish(topic, payload, retain=retain),
-                    self.PUBLISH_TIMEOUT_S,
+                    _PUBLISH_TIMEOUT_S,
                 )
                 # Successful publish — pop and continue
                 self._outbox.pop(0)
@@ -209,7 +261,7 @@ class HomeAssistantClient:
             return False
         if isinstance(payload, str):
             payload = payload.encode("utf-8")
-        if len(self._outbox) >= self.OUTBOX_MAX:
+        if len(self._outbox) >= _OUTBOX_MAX:
             # Drop oldest — if we're this backed up, freshest data is more useful
             dropped = self._outbox.pop(0)
             log(f"Outbox full, dropped oldest: {dropped[0]}")
@@ -222,17 +274,15 @@ class HomeAssistantClient:
         if not self.is_configured:
             log("HA not configured")
             return False
-        ok_action = self.enqueue(f"{self._device_id}/action", button_id)
-        ok_event = self.enqueue(
-            f"{self._device_id}/event",
-            json.dumps({"event_type": button_id}),
-        )
+        ok_action = self.enqueue(self._topic_action, button_id)
+        # Fixed schema, ASCII ids: %-format instead of json.dumps
+        ok_event = self.enqueue(self._topic_event, '{"event_type":"%s"}' % button_id)
         if ok_action and ok_event:
             log(f"Enqueued button: {button_id}")
         return ok_action and ok_event
 
-    def send_battery(self, percent, voltage, raw_uv=0, force=False, wake_count=None):
-        """Enqueue a battery state publish.
+    def send_battery(self, percent, mv, raw_uv=0, force=False, wake_count=None):
+        """Enqueue a battery state publish. mv is the battery voltage in mV.
 
         force=True bypasses the 10-min rate limit; used for boot/wake/pre-sleep.
         force=False piggy-backs on button presses and skips if within the window.
@@ -242,20 +292,20 @@ class HomeAssistantClient:
             return False
         now = time.ticks_ms()
         if not force and self._last_battery_report != 0:
-            if time.ticks_diff(now, self._last_battery_report) < self.BATTERY_REPORT_INTERVAL_MS:
+            if time.ticks_diff(now, self._last_battery_report) < _BATTERY_REPORT_INTERVAL_MS:
                 return True
-        body = {
-            "percent": percent,
-            "voltage": round(voltage, 3),
-            "raw_uv": raw_uv,
-        }
-        if wake_count is not None:
-            body["wake_count"] = wake_count
-        ok = self.enqueue(f"{self._device_id}/battery", json.dumps(body))
+        # Tiny fixed schema — %-format is far cheaper than json.dumps on a dict
+        if wake_count is None:
+            body = '{"percent":%d,"voltage":%d.%03d,"raw_uv":%d}' % (
+                percent, mv // 1000, mv % 1000, raw_uv)
+        else:
+            body = '{"percent":%d,"voltage":%d.%03d,"raw_uv":%d,"wake_count":%d}' % (
+                percent, mv // 1000, mv % 1000, raw_uv, wake_count)
+        ok = self.enqueue(self._topic_battery, body)
         if ok:
             self._last_battery_report = now
             suffix = f", wake#{wake_count}" if wake_count is not None else ""
-            log(f"Enqueued battery: {percent}% ({voltage:.3f}V, raw {raw_uv}uV{suffix}){' [forced]' if force else ''}")
+            log(f"Enqueued battery: {percent}% ({mv}mV, raw {raw_uv}uV{suffix}){' [forced]' if force else ''}")
         return ok
 
     def time_since_last_battery_ms(self):
@@ -265,134 +315,88 @@ class HomeAssistantClient:
 
     # --- discovery ---
 
-    async def _publish_json(self, topic, obj, retain=False):
-        """Publish a dict as JSON, always as bytes. mqtt_as's publish uses
-        len(str) for the MQTT remaining-length header but sends UTF-8 bytes,
-        so a str with any non-ASCII char produces a malformed packet."""
-        await self._client.publish(topic, json.dumps(obj).encode("utf-8"), retain=retain)
+    def _build_discovery(self):
+        """Render every retained discovery (topic, payload) pair once.
 
-    async def _send_discovery(self):
-        """Publish retained discovery configs. Awaits mqtt_as.publish directly
-        because this runs on the connection-up event, not via the outbox."""
+        Everything here is fixed for the life of the process (device id,
+        config flags, firmware version — config changes go through a reboot),
+        so reconnects just replay the cached bytes. Payloads are always bytes:
+        mqtt_as's publish uses len(str) for the MQTT remaining-length header
+        but sends UTF-8 bytes, so a str with any non-ASCII char produces a
+        malformed packet."""
+        dev = self._device_id
         device_info = {
-            "identifiers": [self._device_id],
+            "identifiers": [dev],
             "name": self.device_name,
             "manufacturer": "DIY",
             "model": "Everything Remote",
             "sw_version": VERSION,
         }
+        out = []
+
+        def add(topic, obj):
+            out.append((topic, json.dumps(obj).encode("utf-8") if obj else b""))
 
-        buttons = [
-            ("power", "Power"),
-            ("shortcut_1", "Shortcut 1"),
-            ("shortcut_2", "Shortcut 2"),
-            ("shortcut_3", "Shortcut 3"),
-            ("shortcut_4", "Shortcut 4"),
-            ("brightness_up", "Brightness Up"),
-            ("brightness_down", "Brightness Down"),
-        ]
-
-        for btn_id, btn_name in buttons:
-            topic = f"homeassistant/device_automation/{self._device_id}/{btn_id}/config"
-            await self._publish_json(topic, {
+        for btn_id, _ in _HA_BUTTONS:
+            add(f"homeassistant/device_automation/{dev}/{btn_id}/config", {
                 "automation_type": "trigger",
                 "type": "button_short_press",
                 "subtype": btn_id,
-                "topic": f"{self._device_id}/action",
+                "topic": f"{dev}/action",
                 "payload": btn_id,
                 "device": device_info,
-            }, retain=True)
+            })
 
         # Event entity: lets HA log every press in Logbook/History with
         # timestamp (device triggers don't show up there). Coexists with the
         # device-trigger discovery above — existing automations still fire.
-        await self._publish_json(
-            f"homeassistant/event/{self._device_id}/button/config",
-            {
-                "name": "Button",
-                "state_topic": f"{self._device_id}/event",
-                "event_types": [btn_id for btn_id, _ in buttons],
-                "unique_id": f"{self._device_id}_button",
-                "device": device_info,
-            },
-            retain=True,
-        )
+        add(f"homeassistant/event/{dev}/button/config", {
+            "name": "Button",
+            "state_topic": f"{dev}/event",
+            "event_types": [btn_id for btn_id, _ in _HA_BUTTONS],
+            "unique_id": f"{dev}_button",
+            "device": device_info,
+        })
 
         # Battery sensors — only advertised if the hardware mod is installed.
         # Blank the retained configs when disabled so HA drops stale entities.
-        if not config.battery_enabled:
-            for subtopic in ("battery", "voltage", "battery_raw_uv", "wake_count"):
-                await self._client.publish(
-                    f"homeassistant/sensor/{self._device_id}/{subtopic}/config",
-                    "", retain=True,
-                )
-            log("Discovery complete (battery disabled)")
-            return
-
-        await self._publish_json(
-            f"homeassistant/sensor/{self._device_id}/battery/config",
-            {
-                "name": "Battery",
-                "device_class": "battery",
-                "unit_of_measurement": "%",
-                "state_topic": f"{self._device_id}/battery",
-                "value_template": "{{ value_json.percent }}",
-                "unique_id": f"{self._device_id}_battery",
-                "device": device_info,
-            },
-            retain=True,
-        )
-
-        await self._publish_json(
-            f"homeassistant/sensor/{self._device_id}/voltage/config",
-            {
-                "name": "Battery Voltage",
-                "device_class": "voltage",
-                "unit_of_measurement": "V",
-                "state_topic": f"{self._device_id}/battery",
-                "value_template": "{{ value_json.voltage }}",
-                "unique_id": f"{self._device_id}_voltage",
-                "device": device_info,
-                "entity_category": "diagnostic",
-            },
-            retain=True,
-        )
-
-        await self._publish_json(
-            f"homeassistant/sensor/{self._device_id}/battery_raw_uv/config",
-            {
-                "name": "Battery ADC Raw",
-                "unit_of_measurement": "uV",  # ASCII: the unit gets displayed as "μV"-free to avoid the len-mismatch bug
-                "state_topic": f"{self._device_id}/battery",
-                "value_template": "{{ value_json.raw_uv }}",
-                "unique_id": f"{self._device_id}_battery_raw_uv",
-                "device": device_info,
-                "entity_category": "diagnostic",
-            },
-            retain=True,
-        )
+        battery = config.battery_enabled
+        for subtopic, name, extra in _BATTERY_SENSORS:
+            obj = None
+            if battery:
+                obj = {
+                    "name": name,
+                    "state_topic": f"{dev}/battery",
+                    "unique_id": f"{dev}_{subtopic}",
+                    "device": device_info,
+                }
+                obj.update(extra)
+            add(f"homeassistant/sensor/{dev}/{subtopic}/config", obj)
 
         # Wake counter (diagnostic). Blank the retained config when disabled
         # so HA drops the entity cleanly.
-        wake_topic = f"homeassistant/sensor/{self._device_id}/wake_count/config"
-        if config.wake_counter_enabled:
-            await self._publish_json(
-                wake_topic,
-                {
-                    "name": "Wake Count",
-                    "state_topic": f"{self._device_id}/battery",
-                    "value_template": "{{ value_json.wake_count | default('') }}",
-                    "unique_id": f"{self._device_id}_wake_count",
-                    "device": device_info,
-                    "entity_category": "diagnostic",
-                    "state_class": "measurement",
-                },
-                retain=True,
-            )
-        else:
-            await self._client.publish(wake_topic, b"", retain=True)
+        obj = None
+        if battery and config.wake_counter_enabled:
+            obj = {
+                "name": "Wake Count",
+                "state_topic": f"{dev}/battery",
+                "value_template": "{{ value_json.wake_count | default('') }}",
+                "unique_id": f"{dev}_wake_count",
+                "device": device_info,
+                "entity_category": "diagnostic",
+                "state_class": "measurement",
+            }
+        add(f"homeassistant/sensor/{dev}/wake_count/config", obj)
+        return out
 
-        log("Discovery complete")
+    async def _send_discovery(self):
+        """Publish retained discovery configs. Awaits mqtt_as.publish directly
+        because this runs on the connection-up event, not via the outbox."""
+        if self._discovery_cache is None:
+            self._discovery_cache = self._build_discovery()
+        for topic, payload in self._discovery_cache:
+            await self._client.publish(topic, payload, retain=True)
+        log("Discovery complete" if config.battery_enabled else "Discovery complete (battery disabled)")
 
 
 # Global HA client instance
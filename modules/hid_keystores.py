@@ -3,78 +3,136 @@
 # https://github.com/Heerkog/MicroPythonBLEHID
 # License: GPL-3.0
 
-import json
-import binascii
+from micropython import const
+import struct
+
+_DEBUG = const(0)  # 1 = print keystore load/save status (errors always print)
 
 try:
-    import esp32
+    import nvs_cache
     HAS_NVS = True
 except ImportError:
     HAS_NVS = False
 
+# Packed secrets blob: per entry, B sec_type + H key length + H value length,
+# then the raw key and value bytes. Legacy blobs are a JSON list ('[' first).
+_ENTRY_HEADER = "<BHH"
+_ENTRY_HEADER_SIZE = struct.calcsize(_ENTRY_HEADER)
+
+
+def _make_key(sec_type, key):
+    """Dict key for a secret: the type byte followed by the peer key bytes."""
+    return bytes((sec_type,)) + key
+
 
 class KeyStore:
     """Generic keystore for BLE bonding secrets."""
 
     def __init__(self):
-        self.secrets = {}
+        self.secrets = {}  # {type byte + key bytes: value bytes}
+        self._by_type = None  # {sec_type: [values]}, rebuilt lazily after edits
+
+    def _values_of_type(self, sec_type):
+        """Secrets of one type in dict order, from the lazily built index."""
+        if self._by_type is None:
+            index = {}
+            for k, val in self.secrets.items():
+                index.setdefault(k[0], []).append(val)
+            self._by_type = index
+        return self._by_type.get(sec_type, ())
 
     def add_secret(self, sec_type, key, value):
-        _key = (sec_type, bytes(key))
-        self.secrets[_key] = bytes(value)
+        self.secrets[_make_key(sec_type, key)] = bytes(value)
+        self._by_type = None
 
     def get_secret(self, sec_type, index, key):
-        _key = (sec_type, bytes(key) if key else None)
-        value = None
-
         if key is None:
             # Lookup by index
-            i = 0
-            for (t, _k), _val in self.secrets.items():
-                if t == sec_type:
-                    if i == index:
-                        value = _val
-                        break
-                    i += 1
-        else:
-            # Try exact key match first
-            value = self.secrets.get(_key, None)
-            if value is None:
-                # Fallback: return first matching sec_type (handles RPA address changes).
-                # Safe because single-peer clearing in _IRQ_SET_SECRET ensures at most
-                # one peer's keys exist.
-                for (t, _k), _val in self.secrets.items():
-                    if t == sec_type:
-                        value = _val
-                        break
-
+            values = self._values_of_type(sec_type)
+            return values[index] if 0 <= index < len(values) else None
+
+        # Try exact key match first
+        value = self.secrets.get(_make_key(sec_type, key), None)
+        if value is None:
+            # Fallback: return first matching sec_type (handles RPA address changes).
+            # Safe because single-peer clearing in _IRQ_SET_SECRET ensures at most
+            # one peer's keys exist.
+            values = self._values_of_type(sec_type)
+            if values:
+                value = values[0]
         return value
 
     def remove_secret(self, sec_type, key):
-        _key = (sec_type, bytes(key))
-        if _key in self.secrets:
-            del self.secrets[_key]
+        self.pop_secret(sec_type, key)
+
+    def pop_secret(self, sec_type, key, default=None):
+        """Remove a secret and return its value, or default if not stored."""
+        value = self.secrets.pop(_make_key(sec_type, key), None)
+        if value is None:
+            return default
+        self._by_type = None
+        return value
 
     def has_secret(self, sec_type, key):
-        _key = (sec_type, bytes(key))
-        return _key in self.secrets
+        return _make_key(sec_type, key) in self.secrets
+
+    def has_other_peer(self, sec_type, key):
+        """True if a secret of this type is stored for a different peer key."""
+        _key = _make_key(sec_type, key)
+        for k in self.secrets:
+            if k[0] == sec_type and k != _key:
+                return True
+        return False
 
     def clear_secrets(self):
         """Remove all stored secrets."""
         self.secrets = {}
-
-    def get_json_secrets(self):
-        return [
-            (sec_type, binascii.b2a_base64(key, newline=False).decode(),
-             binascii.b2a_base64(value, newline=False).decode())
-            for (sec_type, key), value in self.secrets.items()
-        ]
+        self._by_type = None
+
+    def get_packed_secrets(self):
+        """Serialize all secrets into the packed binary blob layout.
+
+        Sizes the output first so the whole blob is one bytearray allocation,
+        filled in place, rather than a concatenation per entry."""
+        size = 0
+        for key, value in self.secrets.items():
+            size += _ENTRY_HEADER_SIZE + len(key) - 1 + len(value)
+        buf = bytearray(size)
+        pos = 0
+        for key, value in self.secrets.items():
+            key_len = len(key) - 1
+            struct.pack_into(_ENTRY_HEADER, buf, pos, key[0], key_len, len(value))
+            pos += _ENTRY_HEADER_SIZE
+            buf[pos:pos + key_len] = memoryview(key)[1:]
+            pos += key_len
+            buf[pos:pos + len(value)] = value
+            pos += len(value)
+        return buf
+
+    def add_packed_secrets(self, data, length):
+        """Parse the first `length` bytes of a packed blob. Returns entry count."""
+        mv = memoryview(data)
+        pos = 0
+        count = 0
+        while pos + _ENTRY_HEADER_SIZE <= length:
+            sec_type, key_len, val_len = struct.unpack_from(_ENTRY_HEADER, data, pos)
+            pos += _ENTRY_HEADER_SIZE
+            key = _make_key(sec_type, mv[pos:pos + key_len])
+            pos += key_len
+            self.secrets[key] = bytes(mv[pos:pos + val_len])
+            pos += val_len
+            count += 1
+        self._by_type = None
+        return count
 
     def add_json_secrets(self, entries):
+        """Load entries from the legacy (sec_type, b64 key, b64 value) list."""
+        import binascii
         for sec_type, key, value in entries:
-            key_bytes = binascii.a2b_base64(key) if isinstance(key, str) else binascii.a2b_base64(key)
-            val_bytes = binascii.a2b_base64(value) if isinstance(value, str) else binascii.a2b_base64(value)
-            self.secrets[(sec_type, key_bytes)] = val_bytes
+            key_bytes = binascii.a2b_base64(key)
+            val_bytes = binascii.a2b_base64(value)
+            self.secrets[_make_key(sec_type, key_bytes)] = val_bytes
+        self._by_type = None
 
     def load_secrets(self):
         pass
@@ -89,23 +147,33 @@ class NVSKeyStore(KeyStore):
     def __init__(self):
         super().__init__()
         if HAS_NVS:
-            self.nvsdata = esp32.NVS("BLE")
+            self.nvsdata = nvs_cache.get("BLE")
         else:
             self.nvsdata = None
+        self._last_saved = None  # blob bytes last read from / written to NVS
 
     def load_secrets(self):
         if not self.nvsdata:
             return
 
         try:
-            data = bytearray(512)
-            num_bytes = self.nvsdata.get_blob("Keys", data)
+            data, num_bytes = nvs_cache.read_blob(self.nvsdata, "Keys")
             if num_bytes > 0:
-                entries = json.loads(data[:num_bytes].decode('utf-8'))
-                self.add_json_secrets(entries)
-                print("Loaded", len(entries), "bonding keys")
+                if data[0] == 0x5B:  # '[' - legacy JSON/base64 blob
+                    import json
+                    entries = json.loads(data[:num_bytes].decode('utf-8'))
+                    self.add_json_secrets(entries)
+                    if _DEBUG:
+                        print("Loaded", len(entries), "bonding keys (legacy), migrating")
+                    self.save_secrets()
+                else:
+                    count = self.add_packed_secrets(data, num_bytes)
+                    self._last_saved = bytes(memoryview(data)[:num_bytes])
+                    if _DEBUG:
+                        print("Loaded", count, "bonding keys")
         except OSError:
-            print("No saved bonding keys")
+            if _DEBUG:
+                print("No saved bonding keys")
         except Exception as e:
             print("Failed to load secrets:", e)
 
@@ -114,10 +182,21 @@ class NVSKeyStore(KeyStore):
             return
 
         try:
-            data = json.dumps(self.get_json_secrets())
-            self.nvsdata.set_blob("Keys", data)
+            data = self.get_packed_secrets()
+            if data == self._last_saved:
+                return
+            if data:
+                self.nvsdata.set_blob("Keys", data)
+            else:
+                # No bonds left; drop the key rather than store a zero-length blob
+                try:
+                    self.nvsdata.erase_key("Keys")
+                except OSError:
+                    pass
             self.nvsdata.commit()
-            print("Saved bonding keys")
+            self._last_saved = data
+            if _DEBUG:
+                print("Saved bonding keys")
         except Exception as e:
             print("Failed to save secrets:", e)
 
@@ -3,6 +3,7 @@
 # https://github.com/Heerkog/MicroPythonBLEHID
 # License: GPL-3.0
 
+import micropython
 from micropython import const
 import struct
 import bluetooth
@@ -10,6 +11,8 @@ from bluetooth import UUID
 import esp32
 from hid_keystores import DefaultKeyStore
 
+_DEBUG = const(0)  # 1 to print BLE bring-up progress
+
 # BLE flags
 F_READ = bluetooth.FLAG_READ
 F_WRITE = bluetooth.FLAG_WRITE
@@ -63,43 +66,61 @@ _GATTS_ERROR_INSUFFICIENT_AUTHENTICATION = const(0x05)
 _GATTS_ERROR_INSUFFICIENT_AUTHORIZATION = const(0x08)
 _GATTS_ERROR_INSUFFICIENT_ENCRYPTION = const(0x0f)
 
+# Fixed characteristic values
+_HID_INFO = b"\x01\x01\x00\x00"  # bcdHID 1.01, country 0, flags 0
+_BAT_FMT = b"\x04\x00\xad\x27\x01\x00\x00"  # uint8, percentage unit
+_CTRL_ZERO = b"\x00"  # HID Control Point
+_PROTO_ONE = b"\x01"  # Protocol Mode: Report
+# Report Reference descriptors: report ID, type (1 = input, 2 = output)
+_REF_KB_IN = b"\x01\x01"
+_REF_KB_OUT = b"\x01\x02"
+_REF_CONS_IN = b"\x02\x01"
+
+
+def _dis_string(s, n):
+    """Encode a Device Information string, zero-padded/truncated to n bytes."""
+    b = s.encode()[:n]
+    return b + bytes(n - len(b))
+
+
+def _build_adv_payload(name=None, services=None, appearance=0):
+    """Build the advertising packet once as immutable bytes.
+
+    Each AD structure is length, type, value; sizes are known up front so
+    the packet is filled in a single preallocated buffer."""
+    fields = [(_ADV_TYPE_FLAGS, b"\x06")]  # General discoverable, BR/EDR not supported
+    if name:
+        fields.append((_ADV_TYPE_NAME, name.encode()))
+    if services:
+        for uuid in services:
+            b = bytes(uuid)
+            if len(b) == 2:
+                fields.append((_ADV_TYPE_UUID16_COMPLETE, b))
+    if appearance:
+        fields.append((_ADV_TYPE_APPEARANCE, struct.pack("<H", appearance)))
+
+    payload = bytearray(sum(2 + len(value) for _, value in fields))
+    pos = 0
+    for adv_type, value in fields:
+        payload[pos] = len(value) + 1
+        payload[pos + 1] = adv_type
+        payload[pos + 2:pos + 2 + len(value)] = value
+        pos += 2 + len(value)
+    return bytes(payload)
+
 
 class Advertiser:
     """BLE advertiser for HID devices."""
 
     def __init__(self, ble, services=None, appearance=960, name="Generic HID"):
         self._ble = ble
-        self._payload = self._advertising_payload(
+        self._payload = _build_adv_payload(
             name=name,
             services=services or [UUID(0x1812)],
             appearance=appearance
         )
         self.advertising = False
 
-    def _advertising_payload(self, name=None, services=None, appearance=0):
-        payload = bytearray()
-
-        def _append(adv_type, value):
-            nonlocal payload
-            payload += struct.pack("BB", len(value) + 1, adv_type) + value
-
-        # Flags: general discoverable, BR/EDR not supported
-        _append(_ADV_TYPE_FLAGS, struct.pack("B", 0x06))
-
-        if name:
-            _append(_ADV_TYPE_NAME, name.encode())
-
-        if services:
-            for uuid in services:
-                b = bytes(uuid)
-                if len(b) == 2:
-                    _append(_ADV_TYPE_UUID16_COMPLETE, b)
-
-        if appearance:
-            _append(_ADV_TYPE_APPEARANCE, struct.pack("<H", appearance))
-
-        return payload
-
     def start_advertising(self, interval_us=100000):
         if not self.advertising:
             self._ble.gap_advertise(interval_us, adv_data=self._payload, connectable=True)
@@ -128,6 +149,10 @@ class HumanInterfaceDevice:
         self.adv = None
         self.device_state = self.DEVICE_STOPPED
         self.conn_handle = None
+        # Parameters the central picked for the link, from _IRQ_CONNECTION_UPDATE
+        self.conn_interval = 0  # units of 1.25 ms
+        self.conn_latency = 0
+        self.supervision_timeout = 0  # units of 10 ms
         self.state_change_callback = None
 
         # Security settings
@@ -141,6 +166,8 @@ class HumanInterfaceDevice:
         self.passkey = 1234
         self.passkey_callback = None
         self.secrets = DefaultKeyStore()
+        self._save_scheduled = False
+        self._save_cb = self._flush_secrets  # bound once, not per IRQ
 
         # Device info
         self.device_name = device_name
@@ -160,8 +187,9 @@ class HumanInterfaceDevice:
         self.pnp_product_id = 0x01
         self.pnp_product_version = 0x0100
 
-        # Battery level
+        # Battery level, mirrored in a 1-byte buffer used for notifications
         self.battery_level = 100
+        self._bat_buf = bytearray((self.battery_level,))
 
         # Service definitions
         self.DIS = (
@@ -187,89 +215,124 @@ class HumanInterfaceDevice:
         )
 
         self.services = [self.DIS, self.BAS]
-        self.characteristics = {}
         self._irq_events = 0  # Bitmask of pending IRQ events for main-loop logging
         self._was_encrypted = False  # Track if encryption was established before disconnect
 
+        # IRQ event -> handler; subclasses override entries to intercept events
+        self._irq_handlers = {
+            _IRQ_CENTRAL_CONNECT: self._on_connect,
+            _IRQ_CENTRAL_DISCONNECT: self._on_disconnect,
+            _IRQ_GATTS_WRITE: self._on_write,
+            _IRQ_GATTS_READ_REQUEST: self._on_read_request,
+            _IRQ_MTU_EXCHANGED: self._on_mtu_exchanged,
+            _IRQ_CONNECTION_UPDATE: self._on_connection_update,
+            _IRQ_ENCRYPTION_UPDATE: self._on_encryption_update,
+            _IRQ_PASSKEY_ACTION: self._on_passkey_action,
+            _IRQ_SET_SECRET: self._on_set_secret,
+            _IRQ_GET_SECRET: self._on_get_secret,
+        }
+
     def ble_irq(self, event, data):
-        if event == _IRQ_CENTRAL_CONNECT:
-            self.conn_handle, _, _ = data
-            self._was_encrypted = False
-            self.set_state(self.DEVICE_CONNECTED)
-            self._irq_events |= 1  # connected
-
-        elif event == _IRQ_CENTRAL_DISCONNECT:
-            self._was_encrypted = self.encrypted
-            self.conn_handle = None
-            self.encrypted = False
-            self.authenticated = False
-            self.bonded = False
-            self.set_state(self.DEVICE_IDLE)
-            self._irq_events |= 2  # disconnected
-
-        elif event == _IRQ_GATTS_WRITE:
-            conn_handle, attr_handle = data
-            value = self._ble.gatts_read(attr_handle)
-            desc, _ = self.characteristics.get(attr_handle, (None, None))
-            if desc:
-                self.characteristics[attr_handle] = (desc, value)
-            return _GATTS_NO_ERROR
+        handler = self._irq_handlers.get(event)
+        if handler:
+            return handler(data)
+
+    def _on_connect(self, data):
+        self.conn_handle, _, _ = data
+        # The controller stops connectable advertising when a central
+        # connects; clear the flag so the restart on disconnect isn't a no-op
+        if self.adv:
+            self.adv.advertising = False
+        self._was_encrypted = False
+        self.set_state(self.DEVICE_CONNECTED)
+        self._irq_events |= 1  # connected
+
+    def _on_disconnect(self, data):
+        self._was_encrypted = self.encrypted
+        self.conn_handle = None
+        self.encrypted = False
+        self.authenticated = False
+        self.bonded = False
+        self.set_state(self.DEVICE_IDLE)
+        self._irq_events |= 2  # disconnected
 
-        elif event == _IRQ_GATTS_READ_REQUEST:
-            conn_handle, attr_handle = data
-            desc, val = self.characteristics.get(attr_handle, (None, None))
-            if conn_handle != self.conn_handle:
-                return _GATTS_ERROR_READ_NOT_PERMITTED
-            if desc is None:
-                return _GATTS_ERROR_INVALID_HANDLE
-            return _GATTS_NO_ERROR
+    def _on_write(self, data):
+        # NimBLE stores written values itself; gatts_read gets them on demand
+        return _GATTS_NO_ERROR
 
-        elif event == _IRQ_MTU_EXCHANGED:
-            _, mtu = data
-            self._ble.config(mtu=mtu)
-
-        elif event == _IRQ_ENCRYPTION_UPDATE:
-            _, self.encrypted, self.authenticated, self.bonded, self.key_size = data
-            self._irq_events |= 4  # encryption update
-
-        elif event == _IRQ_PASSKEY_ACTION:
-            conn_handle, action, passkey = data
-            self._irq_events |= 8  # passkey
-            if action == _PASSKEY_ACTION_DISP:
-                self._ble.gap_passkey(conn_handle, action, self.passkey)
-            elif action == _PASSKEY_ACTION_NUMCMP:
-                self._ble.gap_passkey(conn_handle, action, 1)
-            elif action == _PASSKEY_ACTION_INPUT:
-                pk = self.passkey_callback() if self.passkey_callback else self.passkey
-                self._ble.gap_passkey(conn_handle, action, pk)
-
-        elif event == _IRQ_SET_SECRET:
-            sec_type, key, value = data
-            if value is None:
-                if self.secrets.has_secret(sec_type, key):
-                    self.secrets.remove_secret(sec_type, key)
-                    self.secrets.save_secrets()
-                    return True
+    def _on_read_request(self, data):
+        # NimBLE only raises this for registered handles and serves the
+        # stored value itself; we just gate reads to the current central.
+        if data[0] == self.conn_handle:
+            return _GATTS_NO_ERROR
+        return _GATTS_ERROR_READ_NOT_PERMITTED
+
+    def _on_mtu_exchanged(self, data):
+        _, mtu = data
+        self._ble.config(mtu=mtu)
+
+    def _on_connection_update(self, data):
+        # The central owns the connection parameters; MicroPython has no
+        # peripheral-side update request, so record what it chose
+        _, self.conn_interval, self.conn_latency, self.supervision_timeout, _ = data
+        self._irq_events |= 32  # connection parameters updated
+
+    def _on_encryption_update(self, data):
+        _, self.encrypted, self.authenticated, self.bonded, self.key_size = data
+        self._irq_events |= 4  # encryption update
+
+    def _on_passkey_action(self, data):
+        conn_handle, action, passkey = data
+        self._irq_events |= 8  # passkey
+        if action == _PASSKEY_ACTION_DISP:
+            self._ble.gap_passkey(conn_handle, action, self.passkey)
+        elif action == _PASSKEY_ACTION_NUMCMP:
+            self._ble.gap_passkey(conn_handle, action, 1)
+        elif action == _PASSKEY_ACTION_INPUT:
+            pk = self.passkey_callback() if self.passkey_callback else self.passkey
+            self._ble.gap_passkey(conn_handle, action, pk)
+
+    def _on_set_secret(self, data):
+        sec_type, key, value = data
+        if value is None:
+            if self.secrets.pop_secret(sec_type, key) is None:
                 return False
-            # When a new peer bonds, clear keys from any previous peer to
-            # avoid exceeding the 512-byte NVS blob limit. A HID remote
-            # bonds with one device at a time. Keys for the same peer
-            # share the same key bytes (peer address), so only clear if
-            # we see a genuinely different peer address.
-            if sec_type in (1, 2) and key:
-                new_addr = bytes(key)
-                for (t, k) in list(self.secrets.secrets):
-                    if t == sec_type and k != new_addr:
-                        self.secrets.clear_secrets()
-                        break
-            self.secrets.add_secret(sec_type, key, value)
-            self.secrets.save_secrets()
-            self._irq_events |= 16  # secret stored
+            self._schedule_save()
             return True
+        # When a new peer bonds, clear keys from any previous peer to
+        # avoid exceeding the 512-byte NVS blob limit. A HID remote
+        # bonds with one device at a time. Keys for the same peer
+        # share the same key bytes (peer address), so only clear if
+        # we see a genuinely different peer address.
+        if sec_type in (1, 2) and key and self.secrets.has_other_peer(sec_type, key):
+            self.secrets.clear_secrets()
+        self.secrets.add_secret(sec_type, key, value)
+        self._schedule_save()
+        self._irq_events |= 16  # secret stored
+        return True
+
+    def _on_get_secret(self, data):
+        sec_type, index, key = data
+        return self.secrets.get_secret(sec_type, index, key)
+
+    def _schedule_save(self):
+        """Save secrets once after the current burst of SET_SECRET events.
+
+        Pairing stores several keys back to back; the scheduled callback
+        runs after the IRQs already queued, so they share one NVS write.
+        """
+        if self._save_scheduled:
+            return
+        try:
+            micropython.schedule(self._save_cb, None)
+            self._save_scheduled = True
+        except RuntimeError:
+            # Schedule queue full: save now rather than risk losing the bond
+            self.secrets.save_secrets()
 
-        elif event == _IRQ_GET_SECRET:
-            sec_type, index, key = data
-            return self.secrets.get_secret(sec_type, index, key)
+    def _flush_secrets(self, _):
+        self._save_scheduled = False
+        self.secrets.save_secrets()
 
     def start(self):
         if self.device_state == self.DEVICE_STOPPED:
@@ -288,31 +351,32 @@ class HumanInterfaceDevice:
             self._ble.config(mitm=False)  # Must be False with NO_INPUT_OUTPUT
             self._ble.config(io=self.io_capability)
             self.set_state(self.DEVICE_IDLE)
-            print("BLE active")
+            if _DEBUG:
+                print("BLE active")
 
     def save_service_characteristics(self, handles):
+        """Return (handle, initial value) pairs for the registered services."""
         h_mod, h_ser, h_fwr, h_hwr, h_swr, h_man, h_pnp = handles[0]
         self.h_bat, h_bfmt = handles[1]
 
-        def string_pack(s, n):
-            return struct.pack(str(n) + "s", s.encode('UTF-8'))
-
-        self.characteristics[h_mod] = ("Model", string_pack(self.model_number, 24))
-        self.characteristics[h_ser] = ("Serial", string_pack(self.serial_number, 16))
-        self.characteristics[h_fwr] = ("FW Rev", string_pack(self.firmware_revision, 8))
-        self.characteristics[h_hwr] = ("HW Rev", string_pack(self.hardware_revision, 16))
-        self.characteristics[h_swr] = ("SW Rev", string_pack(self.software_revision, 8))
-        self.characteristics[h_man] = ("Manufacturer", string_pack(self.manufacture_name, 36))
-        self.characteristics[h_pnp] = ("PnP", struct.pack(">BHHH",
-            self.pnp_manufacturer_source,
-            self.pnp_manufacturer_uuid,
-            self.pnp_product_id,
-            self.pnp_product_version))
-        self.characteristics[self.h_bat] = ("Battery", struct.pack("<B", self.battery_level))
-        self.characteristics[h_bfmt] = ("BatteryFmt", b'\x04\x00\xad\x27\x01\x00\x00')
-
-    def write_service_characteristics(self):
-        for handle, (_, value) in self.characteristics.items():
+        return (
+            (h_mod, _dis_string(self.model_number, 24)),
+            (h_ser, _dis_string(self.serial_number, 16)),
+            (h_fwr, _dis_string(self.firmware_revision, 8)),
+            (h_hwr, _dis_string(self.hardware_revision, 16)),
+            (h_swr, _dis_string(self.software_revision, 8)),
+            (h_man, _dis_string(self.manufacture_name, 36)),
+            (h_pnp, struct.pack(">BHHH",
+                self.pnp_manufacturer_source,
+                self.pnp_manufacturer_uuid,
+                self.pnp_product_id,
+                self.pnp_product_version)),
+            (self.h_bat, self._bat_buf),
+            (h_bfmt, _BAT_FMT),
+        )
+
+    def write_service_characteristics(self, pairs):
+        for handle, value in pairs:
             self._ble.gatts_write(handle, value)
 
     def stop(self):
@@ -358,20 +422,84 @@ class HumanInterfaceDevice:
 
     def set_battery_level(self, level):
         self.battery_level = max(0, min(100, level))
+        self._bat_buf[0] = self.battery_level
 
     def notify_battery_level(self):
         if self.is_connected():
-            value = struct.pack("<B", self.battery_level)
-            self.characteristics[self.h_bat] = ("Battery", value)
-            self._ble.gatts_notify(self.conn_handle, self.h_bat, value)
+            self._ble.gatts_notify(self.conn_handle, self.h_bat, self._bat_buf)
 
     def notify_hid_report(self):
         pass
 
 
+@micropython.native
+def pack_modifiers(right_gui=0, right_alt=0, right_shift=0, right_control=0,
+                   left_gui=0, left_alt=0, left_shift=0, left_control=0):
+    """Pack modifier flags into the HID keyboard report modifier byte."""
+    return ((right_gui << 7) | (right_alt << 6) | (right_shift << 5) |
+            (right_control << 4) | (left_gui << 3) | (left_alt << 2) |
+            (left_shift << 1) | left_control)
+
+
+# HID Report Descriptor for keyboard + consumer control. Adjacent bytes
+# literals are joined at compile time, so the frozen map stays in flash.
+_HID_REPORT_MAP = (
+    # Keyboard Report (ID 1)
+    b"\x05\x01"     # Usage Page (Generic Desktop)
+    b"\x09\x06"     # Usage (Keyboard)
+    b"\xA1\x01"     # Collection (Application)
+    b"\x85\x01"     #   Report ID (1)
+    b"\x75\x01"     #   Report Size (1)
+    b"\x95\x08"     #   Report Count (8)
+    b"\x05\x07"     #   Usage Page (Key Codes)
+    b"\x19\xE0"     #   Usage Minimum (224)
+    b"\x29\xE7"     #   Usage Maximum (231)
+    b"\x15\x00"     #   Logical Minimum (0)
+    b"\x25\x01"     #   Logical Maximum (1)
+    b"\x81\x02"     #   Input (Data, Variable, Absolute) - Modifiers
+    b"\x95\x01"     #   Report Count (1)
+    b"\x75\x08"     #   Report Size (8)
+    b"\x81\x01"     #   Input (Constant) - Reserved byte
+    b"\x95\x05"     #   Report Count (5)
+    b"\x75\x01"     #   Report Size (1)
+    b"\x05\x08"     #   Usage Page (LEDs)
+    b"\x19\x01"     #   Usage Minimum (1)
+    b"\x29\x05"     #   Usage Maximum (5)
+    b"\x91\x02"     #   Output (Data, Variable, Absolute) - LED report
+    b"\x95\x01"     #   Report Count (1)
+    b"\x75\x03"     #   Report Size (3)
+    b"\x91\x01"     #   Output (Constant) - LED padding
+    b"\x95\x06"     #   Report Count (6)
+    b"\x75\x08"     #   Report Size (8)
+    b"\x15\x00"     #   Logical Minimum (0)
+    b"\x25\x65"     #   Logical Maximum (101)
+    b"\x05\x07"     #   Usage Page (Key Codes)
+    b"\x19\x00"     #   Usage Minimum (0)
+    b"\x29\x65"     #   Usage Maximum (101)
+    b"\x81\x00"     #   Input (Data, Array) - Key array
+    b"\xC0"         # End Collection
+
+    # Consumer Control Report (ID 2)
+    b"\x05\x0C"     # Usage Page (Consumer)
+    b"\x09\x01"     # Usage (Consumer Control)
+    b"\xA1\x01"     # Collection (Application)
+    b"\x85\x02"     #   Report ID (2)
+    b"\x15\x00"     #   Logical Minimum (0)
+    b"\x26\xFF\x03" # Logical Maximum (1023)
+    b"\x19\x00"     #   Usage Minimum (0)
+    b"\x2A\xFF\x03" # Usage Maximum (1023)
+    b"\x75\x10"     #   Report Size (16)
+    b"\x95\x01"     #   Report Count (1)
+    b"\x81\x00"     #   Input (Data, Array)
+    b"\xC0"         # End Collection
+)
+
+
 class Keyboard(HumanInterfaceDevice):
     """BLE HID Keyboard with Consumer Control support."""
 
+    HID_INPUT_REPORT = _HID_REPORT_MAP
+
     def __init__(self, name="BLE Keyboard"):
         super().__init__(name)
         self.device_appearance = 961  # Keyboard
@@ -395,136 +523,85 @@ class Keyboard(HumanInterfaceDevice):
             ),
         )
 
-        # HID Report Descriptor for keyboard + consumer control
-        self.HID_INPUT_REPORT = bytes([
-            # Keyboard Report (ID 1)
-            0x05, 0x01,  # Usage Page (Generic Desktop)
-            0x09, 0x06,  # Usage (Keyboard)
-            0xA1, 0x01,  # Collection (Application)
-            0x85, 0x01,  #   Report ID (1)
-            0x75, 0x01,  #   Report Size (1)
-            0x95, 0x08,  #   Report Count (8)
-            0x05, 0x07,  #   Usage Page (Key Codes)
-            0x19, 0xE0,  #   Usage Minimum (224)
-            0x29, 0xE7,  #   Usage Maximum (231)
-            0x15, 0x00,  #   Logical Minimum (0)
-            0x25, 0x01,  #   Logical Maximum (1)
-            0x81, 0x02,  #   Input (Data, Variable, Absolute) - Modifiers
-            0x95, 0x01,  #   Report Count (1)
-            0x75, 0x08,  #   Report Size (8)
-            0x81, 0x01,  #   Input (Constant) - Reserved byte
-            0x95, 0x05,  #   Report Count (5)
-            0x75, 0x01,  #   Report Size (1)
-            0x05, 0x08,  #   Usage Page (LEDs)
-            0x19, 0x01,  #   Usage Minimum (1)
-            0x29, 0x05,  #   Usage Maximum (5)
-            0x91, 0x02,  #   Output (Data, Variable, Absolute) - LED report
-            0x95, 0x01,  #   Report Count (1)
-            0x75, 0x03,  #   Report Size (3)
-            0x91, 0x01,  #   Output (Constant) - LED padding
-            0x95, 0x06,  #   Report Count (6)
-            0x75, 0x08,  #   Report Size (8)
-            0x15, 0x00,  #   Logical Minimum (0)
-            0x25, 0x65,  #   Logical Maximum (101)
-            0x05, 0x07,  #   Usage Page (Key Codes)
-            0x19, 0x00,  #   Usage Minimum (0)
-            0x29, 0x65,  #   Usage Maximum (101)
-            0x81, 0x00,  #   Input (Data, Array) - Key array
-            0xC0,        # End Collection
-
-            # Consumer Control Report (ID 2)
-            0x05, 0x0C,  # Usage Page (Consumer)
-            0x09, 0x01,  # Usage (Consumer Control)
-            0xA1, 0x01,  # Collection (Application)
-            0x85, 0x02,  #   Report ID (2)
-            0x15, 0x00,  #   Logical Minimum (0)
-            0x26, 0xFF, 0x03,  # Logical Maximum (1023)
-            0x19, 0x00,  #   Usage Minimum (0)
-            0x2A, 0xFF, 0x03,  # Usage Maximum (1023)
-            0x75, 0x10,  #   Report Size (16)
-            0x95, 0x01,  #   Report Count (1)
-            0x81, 0x00,  #   Input (Data, Array)
-            0xC0,        # End Collection
-        ])
-
-        # Keyboard state
-        self.modifiers = 0
-        self.keypresses = [0x00] * 6
+        # Report buffers, updated in place and notified directly.
+        # Keyboard: modifiers, reserved, six keycodes. Consumer: 16-bit LE usage.
+        self._kb_report = bytearray(8)
+        self._consumer_report = bytearray(2)
         self.kb_callback = None
 
-        # Consumer control state
-        self.consumer_code = 0
-
         self.services.append(self.HIDS)
-
-    def ble_irq(self, event, data):
-        if event == _IRQ_GATTS_WRITE:
-            conn_handle, attr_handle = data
-            if hasattr(self, 'h_repout') and attr_handle == self.h_repout:
-                report = self._ble.gatts_read(attr_handle)
-                if self.kb_callback:
-                    self.kb_callback(struct.unpack("B", report))
-                return _GATTS_NO_ERROR
-        return super().ble_irq(event, data)
+        self.h_repout = None
+        self._irq_handlers[_IRQ_GATTS_WRITE] = self._kb_on_write
+
+    def _kb_on_write(self, data):
+        conn_handle, attr_handle = data
+        if attr_handle == self.h_repout:
+            report = self._ble.gatts_read(attr_handle)
+            if self.kb_callback:
+                self.kb_callback(struct.unpack("B", report))
+            return _GATTS_NO_ERROR
+        return self._on_write(data)
 
     def start(self):
         super().start()
-        print("Registering HID services")
+        if _DEBUG:
+            print("Registering HID services")
         handles = self._ble.gatts_register_services(self.services)
-        self.save_service_characteristics(handles)
-        self.write_service_characteristics()
+        pairs = self.save_service_characteristics(handles)
+        self.write_service_characteristics(pairs)
         self.adv = Advertiser(self._ble, [UUID(0x1812)], self.device_appearance, self.device_name)
-        print("Keyboard ready")
+        if _DEBUG:
+            print("Keyboard ready")
 
     def save_service_characteristics(self, handles):
-        super().save_service_characteristics(handles)
+        pairs = super().save_service_characteristics(handles)
 
         # Unpack handles for HID service
         # Order: info, report_map, ctrl, kb_input, kb_ref, kb_output, kb_out_ref, consumer_input, consumer_ref, proto
         h_info, h_hid, h_ctrl, self.h_rep, h_d1, self.h_repout, h_d2, self.h_rep_consumer, h_d3, h_proto = handles[2]
 
-        state = struct.pack("8B", self.modifiers, 0,
-                           self.keypresses[0], self.keypresses[1],
-                           self.keypresses[2], self.keypresses[3],
-                           self.keypresses[4], self.keypresses[5])
-
-        consumer_state = struct.pack("<H", self.consumer_code)
-
-        self.characteristics[h_info] = ("HID Info", b"\x01\x01\x00\x00")
-        self.characteristics[h_hid] = ("Report Map", self.HID_INPUT_REPORT)
-        self.characteristics[h_ctrl] = ("Control", b"\x00")
-        self.characteristics[self.h_rep] = ("KB Input", state)
-        self.characteristics[h_d1] = ("KB Input Ref", struct.pack("<BB", 1, 1))  # Report ID 1, Input
-        self.characteristics[self.h_repout] = ("KB Output", state)
-        self.characteristics[h_d2] = ("KB Output Ref", struct.pack("<BB", 1, 2))  # Report ID 1, Output
-        self.characteristics[self.h_rep_consumer] = ("Consumer Input", consumer_state)
-        self.characteristics[h_d3] = ("Consumer Ref", struct.pack("<BB", 2, 1))  # Report ID 2, Input
-        self.characteristics[h_proto] = ("Protocol", b"\x01")
+        return pairs + (
+            (h_info, _HID_INFO),
+            (h_hid, self.HID_INPUT_REPORT),
+            (h_ctrl, _CTRL_ZERO),
+            (self.h_rep, self._kb_report),
+            (h_d1, _REF_KB_IN),
+            (self.h_repout, bytes(self._kb_report)),
+            (h_d2, _REF_KB_OUT),
+            (self.h_rep_consumer, self._consumer_report),
+            (h_d3, _REF_CONS_IN),
+            (h_proto, _PROTO_ONE),
+        )
 
+    @micropython.native
     def notify_hid_report(self):
         if self.is_connected():
-            state = struct.pack("8B", self.modifiers, 0,
-                               self.keypresses[0], self.keypresses[1],
-                               self.keypresses[2], self.keypresses[3],
-                               self.keypresses[4], self.keypresses[5])
-            self.characteristics[self.h_rep] = ("KB Input", state)
-            self._ble.gatts_notify(self.conn_handle, self.h_rep, state)
+            self._ble.gatts_notify(self.conn_handle, self.h_rep, self._kb_report)
 
+    @micropython.native
     def notify_consumer_report(self):
         """Send consumer control report (media keys)."""
         if self.is_connected():
-            state = struct.pack("<H", self.consumer_code)
-            self.characteristics[self.h_rep_consumer] = ("Consumer Input", state)
-            self._ble.gatts_notify(self.conn_handle, self.h_rep_consumer, state)
+            self._ble.gatts_notify(self.conn_handle, self.h_rep_consumer, self._consumer_report)
 
     def set_modifiers(self, right_gui=0, right_alt=0, right_shift=0, right_control=0,
                       left_gui=0, left_alt=0, left_shift=0, left_control=0):
-        self.modifiers = ((right_gui << 7) | (right_alt << 6) | (right_shift << 5) |
-                         (right_control << 4) | (left_gui << 3) | (left_alt << 2) |
-                         (left_shift << 1) | left_control)
+        self._kb_report[0] = pack_modifiers(right_gui, right_alt, right_shift, right_control,
+                                            left_gui, left_alt, left_shift, left_control)
+
+    def set_modifier_byte(self, modifiers):
+        """Set the modifier byte directly, e.g. a pack_modifiers() constant."""
+        self._kb_report[0] = modifiers
 
+    @micropython.native
     def set_keys(self, k0=0x00, k1=0x00, k2=0x00, k3=0x00, k4=0x00, k5=0x00):
-        self.keypresses = [k0, k1, k2, k3, k4, k5]
+        r = self._kb_report
+        r[2] = k0
+        r[3] = k1
+        r[4] = k2
+        r[5] = k3
+        r[6] = k4
+        r[7] = k5
 
     def set_consumer(self, code=0x00):
         """Set consumer control code. Common codes:
@@ -541,7 +618,9 @@ class Keyboard(HumanInterfaceDevice):
         0x223 = AC Home
         0x224 = AC Back
         """
-        self.consumer_code = code
+        r = self._consumer_report
+        r[0] = code & 0xFF
+        r[1] = code >> 8
 
     def set_kb_callback(self, callback):
         self.kb_callback = callback
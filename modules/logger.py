@@ -1,58 +1,87 @@
 # Simple file logger for Something Remote
 # Logs to flash so we can debug without serial
 
+import os
 import time
 
 LOG_FILE = "/log.txt"
-MAX_LOG_SIZE = 8000  # Keep log small to not fill flash
+OLD_LOG_FILE = "/log.1.txt"  # Previous half, rotated out of LOG_FILE
+MAX_LOG_SIZE = 8000  # Keep log small to not fill flash (split across both files)
 
+# Open handle and size of LOG_FILE, kept across calls
+_active_fp = None
+_active_bytes = 0
 
-def _timestamp():
-    """Get timestamp string."""
-    t = time.localtime()
-    return f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}"
 
+def _open_active():
+    global _active_fp, _active_bytes
+    _active_fp = open(LOG_FILE, "a")
+    try:
+        _active_bytes = os.stat(LOG_FILE)[6]
+    except OSError:
+        _active_bytes = 0
 
-def log(msg):
-    """Log a message to file and print."""
-    line = f"[{_timestamp()}] {msg}"
-    print(line)
 
+def _rotate():
+    """Move the full active file aside and start a fresh one."""
+    global _active_fp, _active_bytes
+    _active_fp.close()
+    _active_fp = None
     try:
-        # Append to log
-        with open(LOG_FILE, "a") as f:
-            f.write(line + "\n")
+        os.remove(OLD_LOG_FILE)
+    except OSError:
+        pass
+    os.rename(LOG_FILE, OLD_LOG_FILE)
+    _active_fp = open(LOG_FILE, "w")
+    _active_bytes = 0
 
-        # Truncate if too large
-        try:
-            import os
-            size = os.stat(LOG_FILE)[6]
-            if size > MAX_LOG_SIZE:
-                # Keep last half
-                with open(LOG_FILE, "r") as f:
-                    content = f.read()
-                with open(LOG_FILE, "w") as f:
-                    f.write(content[len(content)//2:])
-        except Exception:
-            pass
+
+def log(msg, *args):
+    """Log a message to file and print. args, if given, are %-formatted into msg."""
+    global _active_bytes
+    if args:
+        msg = msg % args
+    t = time.localtime()
+    line = "[%02d:%02d:%02d] %s\n" % (t[3], t[4], t[5], msg)
+    print(line, end="")
+
+    try:
+        if _active_fp is None:
+            _open_active()
+        _active_fp.write(line)
+        _active_fp.flush()
+        _active_bytes += len(line.encode())  # bytes, not chars: lines can hold "→"
+
+        if _active_bytes > MAX_LOG_SIZE // 2:
+            _rotate()
     except Exception as e:
         print(f"Log error: {e}")
 
 
 def read_log():
-    """Read and print the log file."""
-    try:
-        with open(LOG_FILE, "r") as f:
-            print(f.read())
-    except Exception:
+    """Read and print the log, oldest entries first."""
+    found = False
+    for path in (OLD_LOG_FILE, LOG_FILE):
+        try:
+            with open(path, "r") as f:
+                print(f.read(), end="")
+            found = True
+        except Exception:
+            pass
+    if not found:
         print("No log file")
 
 
 def clear_log():
     """Clear the log file."""
-    try:
-        import os
-        os.remove(LOG_FILE)
-        print("Log cleared")
-    except Exception:
-        pass
+    global _active_fp, _active_bytes
+    if _active_fp is not None:
+        _active_fp.close()
+        _active_fp = None
+    _active_bytes = 0
+    for path in (LOG_FILE, OLD_LOG_FILE):
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+    print("Log cleared")
@@ -9,11 +9,15 @@ SKIP_PIN = 22
 
 print("Something Remote - boot")
 
-# Check if SELECT button is held (active LOW)
+# Check if SELECT button is held (active LOW). Only debounce when it
+# reads pressed, so a normal boot doesn't wait.
 skip_btn = Pin(SKIP_PIN, Pin.IN, Pin.PULL_UP)
-time.sleep_ms(100)  # Debounce
+held = skip_btn.value() == 0
+if held:
+    time.sleep_ms(20)  # Debounce
+    held = skip_btn.value() == 0
 
-if skip_btn.value() == 0:
+if held:
     print("SELECT held - skipping auto-start")
     print("Run: from shield_remote import main; main()")
 else:
@@ -2,8 +2,11 @@
 # Configures MPU6050 to trigger INT pin HIGH on motion for ESP32 wake
 
 from machine import I2C, Pin
+from micropython import const
 import time
 
+_DEBUG = const(0)  # 1 to print init progress; errors are always printed
+
 # MPU6050 I2C address
 MPU6050_ADDR = 0x68
 
@@ -17,6 +20,25 @@ REG_MOT_DUR = 0x20  # Motion detection duration
 REG_ACCEL_CONFIG = 0x1C
 REG_MOT_DETECT_CTRL = 0x69
 REG_WHO_AM_I = 0x75
+_REG_INT_STATUS = const(0x3A)
+
+# Motion-detect register values, grouped into burst writes of adjacent registers.
+# ACCEL_CONFIG bits [2:0] = ACCEL_HPF: 001 = 5Hz cutoff. The HPF is CRITICAL
+# for motion detection to work.
+_ACCEL_CONFIG = b"\x01"
+# MOT_THR: 1-255, each LSB = 2mg at ±2g scale. 50 (~100mg) — 20 (40mg) was
+# catching ambient vibration (TV, walking past) and waking every ~15 min,
+# burning battery via the idle timer. 100mg still reliably triggers on
+# pick-up. MOT_DUR: 1 ms.
+_MOT_THR_DUR = b"\x32\x01"
+# MOT_DETECT_CTRL: 0x15 = proper decrement and delay settings
+_MOT_DETECT_CTRL = b"\x15"
+# INT_PIN_CFG 0x30: active HIGH, push-pull, LATCH_INT_EN=1, INT_RD_CLEAR=1.
+# INT_ENABLE 0x40: MOT_EN.
+_INT_CFG_ENABLE = b"\x30\x40"
+# PWR_MGMT_1 0x28: CYCLE=1, SLEEP=0, TEMP_DIS=1.
+# PWR_MGMT_2 0x47: LP_WAKE_CTRL = 01 (5Hz sample rate), gyro disabled.
+_PWR_MGMT_CYCLE = b"\x28\x47"
 
 
 class MPU6050Wake:
@@ -30,6 +52,8 @@ class MPU6050Wake:
         self._initialized = False
         self.sda_pin = sda_pin
         self.scl_pin = scl_pin
+        self._int = None  # INT pin, created once init() succeeds
+        self._reg_buf = bytearray(1)  # Reused for single-register reads
 
     def init(self):
         """Initialize MPU6050 for motion detection, then release I2C pins."""
@@ -37,15 +61,16 @@ class MPU6050Wake:
             # Initialize I2C
             self._i2c = I2C(0, sda=Pin(self.sda_pin), scl=Pin(self.scl_pin), freq=400000)
 
-            # Check if MPU6050 is present
-            devices = self._i2c.scan()
-            if MPU6050_ADDR not in devices:
-                print(f"MPU6050 not found at 0x{MPU6050_ADDR:02X}, found: {[hex(d) for d in devices]}")
+            # Probe by reading WHO_AM_I directly: a NAK raises OSError, so
+            # this replaces a full bus scan with a single transaction.
+            try:
+                who = self._read_byte(REG_WHO_AM_I)
+            except OSError:
+                print(f"MPU6050 not found at 0x{MPU6050_ADDR:02X}")
                 self._release_i2c_pins()
                 return False
 
-            # Verify WHO_AM_I register (should be 0x68)
-            who = self._read_byte(REG_WHO_AM_I)
+            # WHO_AM_I should be 0x68
             if who != 0x68:
                 print(f"MPU6050 WHO_AM_I mismatch: got 0x{who:02X}, expected 0x68")
                 # Some clones return different values, continue anyway
@@ -57,12 +82,15 @@ class MPU6050Wake:
             # Configure for low power motion detection
             self._configure_motion_detect()
 
+            self._int = Pin(self.int_pin, Pin.IN)
             self._initialized = True
-            print("MPU6050 initialized for motion wake")
+            if _DEBUG:
+                print("MPU6050 initialized for motion wake")
 
             # Release I2C pins so they can be used for buttons
             self._release_i2c_pins()
-            print("I2C pins released - Shortcut4 button available")
+            if _DEBUG:
+                print("I2C pins released - Shortcut4 button available")
 
             return True
 
@@ -88,49 +116,35 @@ class MPU6050Wake:
 
     def _read_byte(self, reg):
         """Read a byte from a register."""
-        return self._i2c.readfrom_mem(MPU6050_ADDR, reg, 1)[0]
+        self._i2c.readfrom_mem_into(MPU6050_ADDR, reg, self._reg_buf)
+        return self._reg_buf[0]
 
     def _configure_motion_detect(self):
-        """Configure motion detection with INT pin HIGH on motion."""
-        # Configure accelerometer with High-Pass Filter enabled
-        # HPF is CRITICAL for motion detection to work
-        # Bits [2:0] = ACCEL_HPF: 001 = 5Hz cutoff
-        self._write_byte(REG_ACCEL_CONFIG, 0x01)
-
-        # Set motion detection threshold (1-255, lower = more sensitive)
-        # Each LSB = 2mg at ±2g scale.
-        # 50 (~100mg) — 20 (40mg) was catching ambient vibration (TV,
-        # walking past) and waking every ~15 min, burning battery via the
-        # idle timer. 100mg still reliably triggers on pick-up.
-        self._write_byte(REG_MOT_THR, 50)
-
-        # Set motion detection duration (1-255 ms)
-        self._write_byte(REG_MOT_DUR, 1)
-
-        # Configure motion detect control
-        # 0x15 = proper decrement and delay settings for motion detection
-        self._write_byte(REG_MOT_DETECT_CTRL, 0x15)
-
-        # Configure INT pin:
-        # Bit 7: INT_LEVEL = 0 (active HIGH)
-        # Bit 6: INT_OPEN = 0 (push-pull)
-        # Bit 5: LATCH_INT_EN = 1 (latched - stays HIGH until status read)
-        # Bit 4: INT_RD_CLEAR = 1 (clear INT on any read)
-        # Latched mode is required for deep sleep wake
-        self._write_byte(REG_INT_PIN_CFG, 0x30)
+        """Configure motion detection with INT pin HIGH on motion.
+
+        Adjacent registers are written in one burst; the MPU6050
+        auto-increments the register address on multi-byte writes.
+        """
+        # ACCEL_CONFIG: accelerometer High-Pass Filter enabled
+        self._i2c.writeto_mem(MPU6050_ADDR, REG_ACCEL_CONFIG, _ACCEL_CONFIG)
+
+        # MOT_THR, MOT_DUR (0x1F-0x20). 0x1D/0x1E (free-fall) are skipped.
+        self._i2c.writeto_mem(MPU6050_ADDR, REG_MOT_THR, _MOT_THR_DUR)
 
-        # Enable motion detection interrupt
-        self._write_byte(REG_INT_ENABLE, 0x40)  # MOT_EN bit
+        # MOT_DETECT_CTRL: decrement and delay settings
+        self._i2c.writeto_mem(MPU6050_ADDR, REG_MOT_DETECT_CTRL, _MOT_DETECT_CTRL)
 
-        # Put into cycle mode for low power (~10µA vs ~3.5mA)
-        # Note: cycle mode works for deep sleep wake but not for active polling
-        # PWR_MGMT_1: CYCLE=1, SLEEP=0, TEMP_DIS=1
-        self._write_byte(REG_PWR_MGMT_1, 0x28)
+        # INT_PIN_CFG, INT_ENABLE (0x37-0x38)
+        # Latched mode is required for deep sleep wake
+        self._i2c.writeto_mem(MPU6050_ADDR, REG_INT_PIN_CFG, _INT_CFG_ENABLE)
 
-        # PWR_MGMT_2: LP_WAKE_CTRL = 01 (5Hz sample rate), disable gyro
-        self._write_byte(REG_PWR_MGMT_2, 0x47)
+        # PWR_MGMT_1, PWR_MGMT_2 (0x6B-0x6C): cycle mode for low power
+        # (~10µA vs ~3.5mA). Cycle mode works for deep sleep wake but not
+        # for active polling.
+        self._i2c.writeto_mem(MPU6050_ADDR, REG_PWR_MGMT_1, _PWR_MGMT_CYCLE)
 
-        print("MPU6050 motion detection configured (threshold=50, HPF=5Hz, cycle mode)")
+        if _DEBUG:
+            print("MPU6050 motion detection configured (threshold=50, HPF=5Hz, cycle mode)")
 
     def get_int_pin(self):
         """Get the interrupt pin object for wake configuration."""
@@ -149,12 +163,12 @@ class MPU6050Wake:
         """
         if not self._initialized:
             return False
-        if Pin(self.int_pin, Pin.IN).value() == 0:
+        if self._int.value() == 0:
             return False
         # INT is HIGH — motion detected. Clear the latch via I2C.
         try:
             i2c = I2C(0, sda=Pin(self.sda_pin), scl=Pin(self.scl_pin), freq=400000)
-            i2c.readfrom_mem(MPU6050_ADDR, 0x3A, 1)  # Read INT_STATUS clears latch
+            i2c.readfrom_mem_into(MPU6050_ADDR, _REG_INT_STATUS, self._reg_buf)  # Clears latch
             del i2c
         except Exception:
             pass
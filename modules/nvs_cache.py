@@ -0,0 +1,40 @@
+# Shared ESP32 NVS handles for Something Remote
+# One esp32.NVS per namespace for the life of the process, so re-creating
+# Config or a keystore (e.g. after a soft reset from the REPL) reuses the
+# existing handle instead of allocating another in internal DRAM.
+
+from micropython import const
+import esp32
+
+_BLOB_READ_START = const(128)  # covers config and one peer's bond keys
+_BLOB_READ_MAX = const(4096)
+# esp32.NVS raises OSError(-esp_err_t); this one means the buffer is too short
+_ESP_ERR_NVS_INVALID_LENGTH = const(-0x110C)
+
+_handles = {}
+
+
+def get(namespace):
+    """Return the cached NVS handle for a namespace, opening it on first use."""
+    nvs = _handles.get(namespace)
+    if nvs is None:
+        nvs = esp32.NVS(namespace)
+        _handles[namespace] = nvs
+    return nvs
+
+
+def read_blob(nvs, key):
+    """Read an NVS blob into a right-sized buffer. Returns (buf, length).
+
+    The binding has no size query, so start small and double only when the
+    read fails for being too short (ESP_ERR_NVS_INVALID_LENGTH). Any other
+    error, e.g. ESP_ERR_NVS_NOT_FOUND for a missing key, propagates at once."""
+    size = _BLOB_READ_START
+    while True:
+        buf = bytearray(size)
+        try:
+            return buf, nvs.get_blob(key, buf)
+        except OSError as e:
+            if e.errno != _ESP_ERR_NVS_INVALID_LENGTH or size >= _BLOB_READ_MAX:
+                raise
+            size *= 2
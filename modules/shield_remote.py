@@ -3,52 +3,58 @@
 # https://www.thestockpot.net/videos/theeverythingremote
 
 from machine import Pin, ADC, deepsleep
+import micropython
+from micropython import const
 import machine
 import esp32
 import time
 import sys
 import asyncio
+from array import array
 from neopixel import NeoPixel
 from hid_services import Keyboard
 from config import config, POWER_MODE_BLE, POWER_MODE_HA
 from ha_client import ha_client
 from logger import log
 from mpu6050_wake import mpu6050
+import nvs_cache
+
+_DEBUG = const(0)  # 1 = log every BLE key press (writes the flash log per press)
 
 # Everything Remote GPIO assignments
-PIN_POWER = 0         # Strapping pin - needs care
-PIN_BACK = 2          # Strapping pin - needs care
-PIN_HOME = 4
-PIN_PLAY_PAUSE = 5
-PIN_UP = 18
-PIN_LEFT = 19
-PIN_SELECT = 22
-PIN_RIGHT = 23
-PIN_DOWN = 25
-PIN_VOL_UP = 12
-PIN_MUTE = 13
-PIN_CH_UP = 14
-PIN_VOL_DOWN = 15
-PIN_SETTINGS = 16
-PIN_CH_DOWN = 17
-PIN_SHORTCUT_3 = 32
-PIN_SHORTCUT_4 = 33
-PIN_BRIGHT_DOWN = 26
-PIN_BRIGHT_UP = 27
-PIN_SHORTCUT_1 = 34   # Input-only, external 10k pull-up (R1 on PCB)
-PIN_SHORTCUT_2 = 35   # Input-only, external 10k pull-up (R2 on PCB)
-PIN_BATTERY = 39      # VN / ADC1_CH3. Hardware mod: 470k/470k divider from VBAT + 1uF cap to GND
+PIN_POWER = const(0)         # Strapping pin - needs care
+PIN_BACK = const(2)          # Strapping pin - needs care
+PIN_HOME = const(4)
+PIN_PLAY_PAUSE = const(5)
+PIN_UP = const(18)
+PIN_LEFT = const(19)
+PIN_SELECT = const(22)
+PIN_RIGHT = const(23)
+PIN_DOWN = const(25)
+PIN_VOL_UP = const(12)
+PIN_MUTE = const(13)
+PIN_CH_UP = const(14)
+PIN_VOL_DOWN = const(15)
+PIN_SETTINGS = const(16)
+PIN_CH_DOWN = const(17)
+PIN_SHORTCUT_3 = const(32)
+PIN_SHORTCUT_4 = const(33)
+PIN_BRIGHT_DOWN = const(26)
+PIN_BRIGHT_UP = const(27)
+PIN_SHORTCUT_1 = const(34)   # Input-only, external 10k pull-up (R1 on PCB)
+PIN_SHORTCUT_2 = const(35)   # Input-only, external 10k pull-up (R2 on PCB)
+PIN_BATTERY = const(39)      # VN / ADC1_CH3. Hardware mod: 470k/470k divider from VBAT + 1uF cap to GND
 
 # Accelerometer interrupt pin for motion wake
-PIN_ACCEL_INT = 36    # Input-only, RTC capable for wake
+PIN_ACCEL_INT = const(36)    # Input-only, RTC capable for wake
 
 # Status LED (optional - Everything Remote board has no LED)
-HAS_LED = False       # Set to True if you add a NeoPixel LED
-LED_PIN = 21          # GPIO for external NeoPixel if added
+HAS_LED = False              # Set to True if you add a NeoPixel LED
+LED_PIN = const(21)          # GPIO for external NeoPixel if added
 
 # RTC GPIO pins that can wake from deep sleep
 # These are the button pins that are also RTC-capable
-WAKE_PINS = [
+WAKE_PINS = (
     PIN_POWER,      # GPIO0
     PIN_BACK,       # GPIO2
     PIN_HOME,       # GPIO4
@@ -62,19 +68,19 @@ WAKE_PINS = [
     PIN_SHORTCUT_3, # GPIO32
     PIN_SHORTCUT_4, # GPIO33
     PIN_SHORTCUT_1, # GPIO34
-]
+)
 
 # Power management settings
 # Each wake from motion or button keeps the device at ~50mA for IDLE_TIMEOUT_MS
 # before deep-sleeping again. 60s is a good balance — most sessions are longer
 # than that anyway (Shield stays connected and resets the timer), but random
 # motion-triggered wakes don't cost 5 minutes of awake current.
-IDLE_TIMEOUT_MS = 60 * 1000              # 1 min no activity → deep sleep
-SLEEP_INHIBIT_MS = 300 * 1000            # 5 min no-sleep for initial pairing
-LOOP_SLEEP_MS = 50                       # 50ms polling
-CPU_FREQ_ACTIVE = 160000000              # 160MHz when connected
-CPU_FREQ_IDLE = 80000000                 # 80MHz when idle
-BATTERY_STALE_MS = 30 * 60 * 1000        # 30 min — republish before sleep if older
+IDLE_TIMEOUT_MS = const(60 * 1000)       # 1 min no activity → deep sleep
+SLEEP_INHIBIT_MS = const(300 * 1000)     # 5 min no-sleep for initial pairing
+LOOP_SLEEP_MS = const(100)               # Housekeeping tick; buttons are IRQ-driven
+CPU_FREQ_ACTIVE = const(160000000)       # 160MHz when connected
+CPU_FREQ_IDLE = const(80000000)          # 80MHz when idle
+BATTERY_STALE_MS = const(30 * 60 * 1000) # 30 min — republish before sleep if older
 
 
 # --- Wake counter (diagnostic, opt-in via config) ---------------------------
@@ -107,77 +113,82 @@ def _store_wake_count(n):
         pass
 
 # LiPo discharge curve at low load (~0.2C), resting voltage.
-# Sorted descending by voltage. Linear interp between points.
+# Sorted descending by voltage (mV). Linear interp between points.
 # Sourced from typical 1S LiPo discharge data; matches Adafruit/Sparkfun tables.
 _LIPO_CURVE = (
-    (4.20, 100), (4.15,  95), (4.11,  90), (4.08,  85),
-    (4.02,  80), (3.98,  75), (3.95,  70), (3.91,  65),
-    (3.87,  60), (3.85,  55), (3.84,  50), (3.82,  45),
-    (3.80,  40), (3.79,  35), (3.77,  30), (3.75,  25),
-    (3.73,  20), (3.71,  15), (3.69,  10), (3.61,   5),
-    (3.27,   0),
+    (4200, 100), (4150,  95), (4110,  90), (4080,  85),
+    (4020,  80), (3980,  75), (3950,  70), (3910,  65),
+    (3870,  60), (3850,  55), (3840,  50), (3820,  45),
+    (3800,  40), (3790,  35), (3770,  30), (3750,  25),
+    (3730,  20), (3710,  15), (3690,  10), (3610,   5),
+    (3270,   0),
 )
 
 
-def _lipo_voltage_to_percent(v):
-    """Linear-interpolate state-of-charge from the LiPo discharge curve."""
+def _lipo_mv_to_percent(v):
+    """Linear-interpolate state-of-charge from the LiPo discharge curve.
+
+    Integer math throughout: v is in mV, the result in whole percent.
+    """
     if v >= _LIPO_CURVE[0][0]:
         return 100
     if v <= _LIPO_CURVE[-1][0]:
         return 0
-    for i in range(len(_LIPO_CURVE) - 1):
-        v_hi, p_hi = _LIPO_CURVE[i]
-        v_lo, p_lo = _LIPO_CURVE[i + 1]
-        if v_lo <= v <= v_hi:
-            frac = (v - v_lo) / (v_hi - v_lo)
-            return int(p_lo + frac * (p_hi - p_lo))
-    return 0
+    # Bisect for the segment with curve[lo] >= v > curve[hi]
+    lo = 0
+    hi = len(_LIPO_CURVE) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) >> 1
+        if _LIPO_CURVE[mid][0] >= v:
+            lo = mid
+        else:
+            hi = mid
+    v_hi, p_hi = _LIPO_CURVE[lo]
+    v_lo, p_lo = _LIPO_CURVE[hi]
+    return p_lo + (v - v_lo) * (p_hi - p_lo) // (v_hi - v_lo)
 
 # HID key codes (USB HID Keyboard Usage Tables - Page 0x07)
-KEY_UP = 0x52
-KEY_DOWN = 0x51
-KEY_LEFT = 0x50
-KEY_RIGHT = 0x4F
-KEY_ENTER = 0x28      # Select
-KEY_ESCAPE = 0x29     # Back (fallback)
-KEY_PAGE_UP = 0x4B    # Channel Up
-KEY_PAGE_DOWN = 0x4E  # Channel Down
-KEY_F1 = 0x3A         # Shortcut 1
-KEY_F2 = 0x3B         # Shortcut 2
-KEY_F3 = 0x3C         # Shortcut 3
-KEY_F4 = 0x3D         # Shortcut 4
-KEY_F5 = 0x3E         # Settings
-KEY_F7 = 0x40         # Brightness Down
-KEY_F8 = 0x41         # Brightness Up
+KEY_UP = const(0x52)
+KEY_DOWN = const(0x51)
+KEY_LEFT = const(0x50)
+KEY_RIGHT = const(0x4F)
+KEY_ENTER = const(0x28)      # Select
+KEY_PAGE_UP = const(0x4B)    # Channel Up
+KEY_PAGE_DOWN = const(0x4E)  # Channel Down
+KEY_F5 = const(0x3E)         # Settings
 
 # Consumer Control codes (USB HID Consumer Page 0x0C)
 # These work for media keys on Shield
-CC_POWER = 0x30       # Power
-CC_MENU = 0x40        # Menu/Home
-CC_PLAY_PAUSE = 0xCD  # Play/Pause
-CC_MUTE = 0xE2        # Mute
-CC_VOL_UP = 0xE9      # Volume Up
-CC_VOL_DOWN = 0xEA    # Volume Down
-CC_HOME = 0x223       # AC Home
-CC_BACK = 0x224       # AC Back
-
-# LED colors (accent LED if present, GRB format)
-COLOR_OFF = (0, 0, 0)
-COLOR_BLUE = (0, 0, 32)       # BLE Advertising
-COLOR_GREEN = (32, 0, 0)      # BLE Connected
-COLOR_WHITE = (32, 32, 32)    # Button pressed
-COLOR_RED = (0, 32, 0)        # Error
-COLOR_PURPLE = (0, 16, 32)    # HA activity (WiFi/MQTT)
-COLOR_YELLOW = (32, 32, 0)    # Setup portal
+CC_POWER = const(0x30)       # Power
+CC_PLAY_PAUSE = const(0xCD)  # Play/Pause
+CC_MUTE = const(0xE2)        # Mute
+CC_VOL_UP = const(0xE9)      # Volume Up
+CC_VOL_DOWN = const(0xEA)    # Volume Down
+CC_HOME = const(0x223)       # AC Home
+CC_BACK = const(0x224)       # AC Back
+
+# LED colors (accent LED if present), packed 0xAABBCC where AA, BB, CC
+# are the three bytes in the order the NeoPixel buffer sends them
+COLOR_OFF = const(0x000000)
+COLOR_BLUE = const(0x000020)     # BLE Advertising
+COLOR_GREEN = const(0x002000)    # BLE Connected
+COLOR_WHITE = const(0x202020)    # Button pressed
+COLOR_RED = const(0x200000)      # Error
+COLOR_PURPLE = const(0x100020)   # HA activity (WiFi/MQTT)
+COLOR_YELLOW = const(0x202000)   # Setup portal
 
 # Button type constants
-TYPE_KEY = 0      # Keyboard HID
-TYPE_CONSUMER = 1 # Consumer Control HID
-TYPE_HA = 2       # Home Assistant (MQTT)
+TYPE_KEY = const(0)      # Keyboard HID
+TYPE_CONSUMER = const(1) # Consumer Control HID
+_TYPE_LABELS = ("Key", "Consumer")  # Indexed by button type, for logging
+
+# Pin numbers and HID codes are const() so uses in this module compile to
+# literals; the button tables are tuples so the frozen module keeps them
+# out of the heap.
 
 # BLE HID Button definitions: (pin, code, name, has_pullup, type)
 # These buttons control the Shield via BLE
-BLE_BUTTONS = [
+BLE_BUTTONS = (
     # Navigation - Keyboard HID
     (PIN_UP, KEY_UP, "Up", True, TYPE_KEY),
     (PIN_DOWN, KEY_DOWN, "Down", True, TYPE_KEY),
@@ -201,21 +212,72 @@ BLE_BUTTONS = [
 
     # Settings - Keyboard HID
     (PIN_SETTINGS, KEY_F5, "Settings", True, TYPE_KEY),
-]
+)
 
 # Home Assistant Button definitions: (pin, ha_action, name, has_pullup)
 # These buttons send MQTT messages to Home Assistant
 # Note: Shortcut1/Shortcut2 (GPIO34/35) are input-only; R1/R2 on the PCB provide external pull-ups
 # Note: Shortcut4 (GPIO33) shared with I2C SDA - I2C released after boot so button works
 # Note: Power button is handled separately based on config.power_button_mode
-HA_BUTTONS = [
+HA_BUTTONS = (
     (PIN_SHORTCUT_1, "shortcut_1", "Shortcut1", False),
     (PIN_SHORTCUT_2, "shortcut_2", "Shortcut2", False),
     (PIN_SHORTCUT_3, "shortcut_3", "Shortcut3", True),
     (PIN_SHORTCUT_4, "shortcut_4", "Shortcut4", True),  # Shared with I2C SDA at boot
     (PIN_BRIGHT_UP, "brightness_up", "Bright+", True),
     (PIN_BRIGHT_DOWN, "brightness_down", "Bright-", True),
-]
+)
+
+
+def _write_led(led, color):
+    """Store a packed color straight into the NeoPixel buffer and send it."""
+    buf = led.buf
+    buf[0] = color >> 16
+    buf[1] = (color >> 8) & 0xFF
+    buf[2] = color & 0xFF
+    led.write()
+
+
+def _debouncing(now, changed_at, debounce_ms):
+    """True while now is within debounce_ms after changed_at.
+
+    Written as a range check so a timestamp old enough for ticks_diff to
+    wrap negative counts as expired rather than blocking the button.
+    """
+    return 0 <= time.ticks_diff(now, changed_at) < debounce_ms
+
+
+# Re-samples after a button IRQ until two consecutive samples agree
+_SETTLE_SCANS = const(4)
+_SETTLE_MS = const(5)
+
+# ESP32 GPIO input level registers: GPIO0-31 and GPIO32-39
+_GPIO_IN_REG = const(0x3FF4403C)
+_GPIO_IN1_REG = const(0x3FF44040)
+
+
+@micropython.viper
+def _read_mask(gpios) -> int:
+    """Pack button levels into an int, bit i = level of GPIO gpios[i].
+
+    Both input registers are read once per sweep instead of calling
+    Pin.value() per button. The Pin objects still own pin configuration.
+    Viper keeps the whole loop in machine-word integers.
+    """
+    lo = ptr32(_GPIO_IN_REG)[0]
+    hi = ptr32(_GPIO_IN1_REG)[0]
+    pins = ptr8(gpios)
+    n = int(len(gpios))
+    mask = 0
+    i = 0
+    while i < n:
+        g = pins[i]
+        if g < 32:
+            mask |= ((lo >> g) & 1) << i
+        else:
+            mask |= ((hi >> (g - 32)) & 1) << i
+        i += 1
+    return mask
 
 
 class ShieldRemote:
@@ -228,6 +290,7 @@ class ShieldRemote:
         # _late_init() which runs after BLE is already advertising.
 
         self.led = None
+        self._led_color = None  # Last color written, to skip redundant writes
         if HAS_LED:
             try:
                 self.led = NeoPixel(Pin(LED_PIN, Pin.OUT), 1)
@@ -242,22 +305,65 @@ class ShieldRemote:
         self.kb = Keyboard(name)
         self.kb.set_state_change_callback(self._on_state_change)
 
-        # Button collections get populated in _late_init(), but exist empty
+        # Button tables get populated in _late_init(), but exist empty
         # here so any IRQ that fires before _late_init doesn't crash.
-        self.ble_buttons = []
-        self.ble_button_states = []
-        self.ha_buttons = []
-        self.ha_button_states = []
+        # Stored as parallel arrays indexed by button number so the poll
+        # loop indexes instead of unpacking a tuple per button.
+        # GPIO numbers of the BLE buttons followed by the HA buttons, so
+        # one _read_mask() call samples every button for a scan
+        self._gpios = b""
+        self._n_ble = 0
+        # Last raw sample and last agreed levels of every button in _gpios
+        self._raw_mask = 0
+        self._stable_mask = 0
+        self._ble_pins = []
+        self._ble_codes = array('H')
+        self._ble_types = bytearray()
+        self._ble_names = ()
+        self._ble_mask = 0  # bit i = level of button i (1 = released)
+        self._ble_released = 0  # mask value with every button released
+        self._ha_pins = []
+        self._ha_actions = ()
+        self._ha_names = ()
+        self._ha_mask = 0
+        self._ha_released = 0
         self._power_btn = None
         self._power_btn_state = 1
+        # Mask bits of the combo buttons, so the combo checks read the
+        # debounced masks instead of constructing Pins every tick
+        self._back_bit = 0
+        self._s1_bit = 0
+        self._s3_bit = 0
+        # Set from button edge IRQs; wakes _button_task to scan immediately
+        self._btn_flag = asyncio.ThreadSafeFlag()
+        # Background tasks started by run(), cancelled before the setup portal
+        self._btn_task = None
+        self._batt_task = None
 
         # State tracking — must all be set before kb.start() because the BLE
         # IRQ callbacks (_on_state_change) read them.
         self._connected = False
-        self._last_press_time = 0
+        # Per-button debounce: ticks_ms of each button's last accepted edge
+        self._ble_changed_at = array('i')
+        self._ha_changed_at = array('i')
+        self._power_changed_at = 0
         self._debounce_ms = 50
         self._any_pressed = False
-        self._active_type = None
+        self._active_type = TYPE_KEY  # Report the next release clears
+        # Report writers indexed by button type (TYPE_KEY, TYPE_CONSUMER)
+        self._senders = (self._send_kb, self._send_cc)
+        self._releasers = (self._release_kb, self._release_cc)
+        # Keyboard state -> handler(was_connected), see _on_state_change
+        self._state_handlers = {
+            Keyboard.DEVICE_CONNECTED: self._on_connected,
+            Keyboard.DEVICE_IDLE: self._on_idle,
+            Keyboard.DEVICE_ADVERTISING: self._on_advertising,
+        }
+        # Reports changed during the current scan, sent by _flush_reports()
+        self._kb_dirty = False
+        self._consumer_dirty = False
+        # A staged press not yet notified; the next edge would overwrite it
+        self._press_pending = False
         self._failed_connects = 0
 
         # Wake counter (diagnostic, opt-in). Load from RTC RAM and bump now so
@@ -273,9 +379,10 @@ class ShieldRemote:
         # Battery monitoring state — ADC itself is initialised in _late_init.
         self._battery_enabled = config.battery_enabled
         self._battery_adc = None
-        self._last_battery_update = 0
         self._battery_update_interval = 60000
         self._last_battery_uv = 0
+        self._battery_mv = 0  # Smoothed VBAT, 0 until the first reading
+        self._battery_percent = 0
 
         self._last_activity = time.ticks_ms()
         self._boot_time = time.ticks_ms()
@@ -299,17 +406,37 @@ class ShieldRemote:
         else:
             log("MPU6050 not found - motion wake disabled")
 
-        for pin_num, code, name, has_pullup, btn_type in BLE_BUTTONS:
-            btn = Pin(pin_num, Pin.IN, Pin.PULL_UP) if has_pullup else Pin(pin_num, Pin.IN)
-            self.ble_buttons.append((btn, code, name, btn_type))
-            self.ble_button_states.append(1)
-
-        for pin_num, action, name, has_pullup in HA_BUTTONS:
-            btn = Pin(pin_num, Pin.IN, Pin.PULL_UP) if has_pullup else Pin(pin_num, Pin.IN)
-            self.ha_buttons.append((btn, action, name))
-            self.ha_button_states.append(1)
+        self._ble_pins = [Pin(b[0], Pin.IN, Pin.PULL_UP) if b[3] else Pin(b[0], Pin.IN)
+                          for b in BLE_BUTTONS]
+        self._ble_codes = array('H', [b[1] for b in BLE_BUTTONS])
+        self._ble_names = tuple(b[2] for b in BLE_BUTTONS)
+        self._ble_types = bytearray(b[4] for b in BLE_BUTTONS)
+        self._ble_released = self._ble_mask = (1 << len(BLE_BUTTONS)) - 1
+        self._ble_changed_at = array('i', [0] * len(BLE_BUTTONS))
+
+        self._ha_pins = [Pin(b[0], Pin.IN, Pin.PULL_UP) if b[3] else Pin(b[0], Pin.IN)
+                         for b in HA_BUTTONS]
+        self._ha_actions = tuple(b[1] for b in HA_BUTTONS)
+        self._ha_names = tuple(b[2] for b in HA_BUTTONS)
+        self._ha_released = self._ha_mask = (1 << len(HA_BUTTONS)) - 1
+        self._ha_changed_at = array('i', [0] * len(HA_BUTTONS))
+
+        self._gpios = bytes(b[0] for b in BLE_BUTTONS + HA_BUTTONS)
+        self._n_ble = len(BLE_BUTTONS)
+        self._raw_mask = self._stable_mask = (1 << len(self._gpios)) - 1
+
+        self._back_bit = 1 << [b[0] for b in BLE_BUTTONS].index(PIN_BACK)
+        ha_pins = [b[0] for b in HA_BUTTONS]
+        self._s1_bit = 1 << ha_pins.index(PIN_SHORTCUT_1)
+        self._s3_bit = 1 << ha_pins.index(PIN_SHORTCUT_3)
 
         self._power_btn = Pin(PIN_POWER, Pin.IN, Pin.PULL_UP)
+        self._power_value = self._power_btn.value  # Bound once for every scan
+
+        # Any edge wakes the button task. The IRQ only sets a flag: the scan
+        # re-reads every level, so bounce edges collapse into one wake-up.
+        for btn in self._ble_pins + self._ha_pins + [self._power_btn]:
+            btn.irq(self._on_button_irq, Pin.IRQ_FALLING | Pin.IRQ_RISING)
 
         if self._battery_enabled:
             self._battery_adc = ADC(Pin(PIN_BATTERY))
@@ -357,7 +484,8 @@ class ShieldRemote:
             log(f"HA stop errored: {e}")
 
         # Configure wake sources BEFORE BLE shutdown
-        power_pin = Pin(PIN_POWER, Pin.IN, Pin.PULL_UP)
+        # Reuse the power button's Pin (already input/pull-up) when it exists
+        power_pin = self._power_btn or Pin(PIN_POWER, Pin.IN, Pin.PULL_UP)
         esp32.wake_on_ext0(power_pin, 0)
         if mpu6050.is_initialized:
             try:
@@ -370,9 +498,9 @@ class ShieldRemote:
             try:
                 if self._connected and self.kb.conn_handle is not None:
                     self.kb._ble.gap_disconnect(self.kb.conn_handle)
-                    time.sleep_ms(200)
+                    await asyncio.sleep_ms(200)
                 self.kb.stop_advertising()
-                time.sleep_ms(100)
+                await asyncio.sleep_ms(100)
                 self.kb.stop()
             except Exception:
                 pass
@@ -380,13 +508,13 @@ class ShieldRemote:
             self._connected = False
         deepsleep()
 
-    async def _check_idle_timeout(self):
+    async def _check_idle_timeout(self, now):
         """Deep-sleep when idle timer expires (async because sleep entry is async)."""
-        idle_time = time.ticks_diff(time.ticks_ms(), self._last_activity)
+        idle_time = time.ticks_diff(now, self._last_activity)
         if idle_time >= IDLE_TIMEOUT_MS:
             # Don't sleep if no bonds and within pairing window
             if len(self.kb.secrets.secrets) <= 1:
-                since_boot = time.ticks_diff(time.ticks_ms(), self._boot_time)
+                since_boot = time.ticks_diff(now, self._boot_time)
                 if since_boot < SLEEP_INHIBIT_MS:
                     return
             await self._enter_deep_sleep()
@@ -401,13 +529,21 @@ class ShieldRemote:
             if not self.kb.adv.advertising:
                 self.kb.start_advertising()
 
-    def _check_forget_combo(self):
-        """Check if Power + Back held for 5 seconds to forget BLE bonds."""
-        # Get Power (GPIO0) and Back (GPIO2) button states
-        power_pressed = Pin(PIN_POWER, Pin.IN, Pin.PULL_UP).value() == 0
-        back_pressed = Pin(PIN_BACK, Pin.IN, Pin.PULL_UP).value() == 0
+    def _check_combos(self, now):
+        """Run the combo checks only while a combo button is held or timing."""
+        if (self._power_btn_state and not self._forget_combo_start
+                and not self._setup_combo_start
+                and not (self._ble_mask ^ self._ble_released) & self._back_bit
+                and not (self._ha_mask ^ self._ha_released) & (self._s1_bit | self._s3_bit)):
+            return
+        self._check_forget_combo(now)
+        self._check_setup_combo(now)
 
-        now = time.ticks_ms()
+    def _check_forget_combo(self, now):
+        """Check if Power + Back held for 5 seconds to forget BLE bonds."""
+        # Debounced Power (GPIO0) and Back (GPIO2) states from the last scan
+        power_pressed = self._power_btn_state == 0
+        back_pressed = (self._ble_mask ^ self._ble_released) & self._back_bit
 
         if power_pressed and back_pressed:
             if self._forget_combo_start == 0:
@@ -416,7 +552,7 @@ class ShieldRemote:
             else:
                 elapsed = time.ticks_diff(now, self._forget_combo_start)
                 # Log progress every second
-                if elapsed > 0 and elapsed % 1000 < 60:
+                if elapsed > 0 and elapsed % 1000 < LOOP_SLEEP_MS:
                     log(f"COMBO: holding... {elapsed//1000}s")
                 if elapsed >= self._forget_combo_duration:
                     log("COMBO: Success! Triggering BLE forget")
@@ -434,18 +570,23 @@ class ShieldRemote:
         kb.secrets.clear_secrets()
         kb.secrets.save_secrets()
         try:
-            nvs = esp32.NVS("nimble_bond")
-            for prefix in ["peer_sec_", "our_sec_", "cccd_", "p_dev_rec_", "rpa_rec_"]:
+            nvs = nvs_cache.get("nimble_bond")
+            erased = False
+            for prefix in ("peer_sec_", "our_sec_", "cccd_", "p_dev_rec_", "rpa_rec_"):
                 for i in range(1, 16):
                     try:
                         nvs.erase_key(prefix + str(i))
+                        erased = True
                     except Exception:
                         continue
             try:
                 nvs.erase_key("local_irk")
+                erased = True
             except Exception:
                 pass
-            nvs.commit()
+            # Nothing to flush if the namespace was already clean
+            if erased:
+                nvs.commit()
         except Exception:
             pass
 
@@ -458,13 +599,12 @@ class ShieldRemote:
         time.sleep_ms(500)
         machine.reset()
 
-    def _check_setup_combo(self):
+    def _check_setup_combo(self, now):
         """Check if Shortcut1 + Shortcut3 held for 5 seconds to enter setup."""
-        # Get Shortcut1 (GPIO34) and Shortcut3 (GPIO32) button states
-        s1_pressed = Pin(PIN_SHORTCUT_1, Pin.IN).value() == 0
-        s3_pressed = Pin(PIN_SHORTCUT_3, Pin.IN, Pin.PULL_UP).value() == 0
-
-        now = time.ticks_ms()
+        # Debounced Shortcut1 (GPIO34) and Shortcut3 (GPIO32) states from the last scan
+        held = self._ha_mask ^ self._ha_released
+        s1_pressed = held & self._s1_bit
+        s3_pressed = held & self._s3_bit
 
         if s1_pressed and s3_pressed:
             if self._setup_combo_start == 0:
@@ -491,6 +631,14 @@ class ShieldRemote:
         print("Entering setup portal...")
         self.set_led(COLOR_YELLOW)
 
+        # The portal's asyncio.run shares this task queue, so stop the
+        # background tasks or buttons and combos would stay live inside it
+        for task in (self._btn_task, self._batt_task):
+            if task is not None:
+                task.cancel()
+        self._btn_task = self._batt_task = None
+        self._connected = False
+
         try:
             # Stop BLE
             if self._ble_ready:
@@ -508,25 +656,31 @@ class ShieldRemote:
             import machine
             machine.reset()
 
-    def _handle_ha_buttons(self):
-        """Handle Home Assistant button presses."""
-        now = time.ticks_ms()
-
-        # Debounce check
-        if time.ticks_diff(now, self._last_press_time) < self._debounce_ms:
+    def _handle_ha_buttons(self, cur):
+        """Handle Home Assistant button presses, cur = HA button levels."""
+        changed = cur ^ self._ha_mask
+        if not changed:
             return
-
-        for i, (btn, action, name) in enumerate(self.ha_buttons):
-            state = btn.value()
-
-            if state != self.ha_button_states[i]:
-                self._last_press_time = now
-                self.ha_button_states[i] = state
-                if state == 0:  # Pressed
-                    self.set_led(COLOR_PURPLE)
-                    self._send_ha_button(action, name)
-                    self._any_pressed = True
-                    self._reset_activity(from_button=True)
+        now = time.ticks_ms()
+        changed_at = self._ha_changed_at
+        i = 0
+        while changed:
+            # Edges inside a button's debounce window stay pending in the
+            # mask difference and are re-checked on the next scan.
+            if changed & 1 and not _debouncing(now, changed_at[i], self._debounce_ms):
+                changed_at[i] = now
+                self._ha_mask ^= 1 << i
+                if not (cur >> i) & 1:  # Pressed
+                    self._ha_press(i)
+            changed >>= 1
+            i += 1
+
+    def _ha_press(self, i):
+        """Act on an accepted press of HA button i."""
+        self.set_led(COLOR_PURPLE)
+        self._send_ha_button(self._ha_actions[i], self._ha_names[i])
+        self._any_pressed = True
+        self._reset_activity(from_button=True)
 
     def _send_ha_button(self, action, name):
         """Send button press to Home Assistant."""
@@ -534,10 +688,13 @@ class ShieldRemote:
         if ha_client.is_configured:
             ha_client.send_button(action)
             # Also send battery if due (piggy-back, rate-limited in send_battery)
+            # Uses the latest periodic reading rather than sampling the ADC per press
             if self._battery_enabled:
-                percent, voltage = self._read_battery()
+                if not self._battery_mv:
+                    self._read_battery()
                 wc = self._wake_count if self._wake_counter_enabled else None
-                ha_client.send_battery(percent, voltage, self._last_battery_uv, wake_count=wc)
+                ha_client.send_battery(self._battery_percent, self._battery_mv,
+                                       self._last_battery_uv, wake_count=wc)
         else:
             log("HA not configured - hold Shortcut1+3 for setup")
 
@@ -545,15 +702,12 @@ class ShieldRemote:
         """Handle power button based on config.power_button_mode."""
         if self._power_btn is None:
             return
-        now = time.ticks_ms()
-
-        # Debounce check
-        if time.ticks_diff(now, self._last_press_time) < self._debounce_ms:
-            return
-
-        state = self._power_btn.value()
+        state = self._power_value()
         if state != self._power_btn_state:
-            self._last_press_time = now
+            now = time.ticks_ms()
+            if _debouncing(now, self._power_changed_at, self._debounce_ms):
+                return
+            self._power_changed_at = now
             self._power_btn_state = state
             if state == 0:  # Pressed
                 self._reset_activity(from_button=True)
@@ -572,44 +726,56 @@ class ShieldRemote:
                     self._release_keys()
 
     def set_led(self, color):
-        """Set LED color (GRB tuple)."""
-        if self.led:
-            self.led[0] = color
-            self.led.write()
+        """Set LED color (packed COLOR_* int). No-op if the LED already shows it."""
+        if self.led and color != self._led_color:
+            _write_led(self.led, color)
+            self._led_color = color
 
     def _read_battery(self):
-        """Read battery voltage and return (percent, voltage).
+        """Read battery voltage and return (percent, millivolts).
 
         Uses calibrated ADC (read_uv), median-of-N sampling to reject the
         VN/VP ADC-glitch erratum, then a LiPo discharge LUT for percent.
         Divider is 2:1 (470k/470k), so VBAT = 2 * pin voltage.
-        Returns (0, 0.0) if battery monitoring is disabled.
+        Successive readings are smoothed (1/8 weight EMA) so the level
+        reported over BLE doesn't jitter with ADC noise.
+        Returns (0, 0) if battery monitoring is disabled.
         """
         if not self._battery_enabled:
-            return 0, 0.0
-        samples = []
-        for _ in range(16):
-            samples.append(self._battery_adc.read_uv())
+            return 0, 0
+        read_uv = self._battery_adc.read_uv
+        samples = [read_uv() for _ in range(16)]
         samples.sort()
         pin_uv = samples[8]  # median
         self._last_battery_uv = pin_uv
 
-        voltage = (pin_uv / 1000000.0) * 2.0  # divider ratio
-        percent = _lipo_voltage_to_percent(voltage)
-        return percent, voltage
+        mv = pin_uv // 500  # divider ratio: 2 * uV / 1000
+        if self._battery_mv:
+            mv = (self._battery_mv * 7 + mv) >> 3
+        self._battery_mv = mv
+        self._battery_percent = percent = _lipo_mv_to_percent(mv)
+        return percent, mv
 
     def _update_battery(self):
-        """Update battery level if interval has passed."""
-        if not self._battery_enabled:
-            return
-        now = time.ticks_ms()
-        if time.ticks_diff(now, self._last_battery_update) >= self._battery_update_interval:
-            self._last_battery_update = now
-            percent, voltage = self._read_battery()
-            self.kb.set_battery_level(percent)
-            if self._connected:
-                self.kb.notify_battery_level()
-            log(f"Battery: {percent}% ({voltage:.2f}V)")
+        """Read the battery and update the BLE battery level."""
+        percent, mv = self._read_battery()
+        self.kb.set_battery_level(percent)
+        if self._connected:
+            self.kb.notify_battery_level()
+        log("Battery: %d%% (%d.%02dV)", percent, mv // 1000, mv % 1000 // 10)
+
+    async def _battery_task(self):
+        """Update the battery level every _battery_update_interval.
+
+        Runs as its own task so the main loop tick doesn't have to check
+        whether the interval has passed.
+        """
+        while True:
+            await asyncio.sleep_ms(self._battery_update_interval)
+            try:
+                self._update_battery()
+            except Exception as e:
+                log(f"Battery update error: {type(e).__name__}: {e}")
 
     def _publish_battery_forced(self):
         """Read battery and force-publish to HA, connecting MQTT if needed.
@@ -620,15 +786,15 @@ class ShieldRemote:
         """
         if not self._battery_enabled:
             return False
-        percent, voltage = self._read_battery()
+        percent, mv = self._read_battery()
         self.kb.set_battery_level(percent)
-        log(f"Battery: {percent}% ({voltage:.2f}V)")
+        log("Battery: %d%% (%d.%02dV)", percent, mv // 1000, mv % 1000 // 10)
         if not ha_client.is_configured:
             return False
         wc = self._wake_count if self._wake_counter_enabled else None
         try:
             return ha_client.send_battery(
-                percent, voltage, self._last_battery_uv, force=True, wake_count=wc,
+                percent, mv, self._last_battery_uv, force=True, wake_count=wc,
             )
         except Exception as e:
             log(f"Battery force-publish failed: {e}")
@@ -648,6 +814,9 @@ class ShieldRemote:
             log("BLE IRQ: Passkey action")
         if evts & 16:
             log(f"BLE IRQ: Secret stored ({len(self.kb.secrets.secrets)} keys)")
+        if evts & 32:
+            kb = self.kb
+            log(f"BLE IRQ: Conn params interval={kb.conn_interval * 5 // 4}ms latency={kb.conn_latency} timeout={kb.supervision_timeout * 10}ms")
         if evts & 2:
             log("BLE IRQ: Disconnected")
 
@@ -655,55 +824,55 @@ class ShieldRemote:
         """Handle BLE state changes. Called from BLE IRQ via set_state callback.
         Note: log() calls here are safe on ESP32 because NimBLE IRQs run as
         MicroPython scheduled callbacks, not true hardware interrupts."""
-        state = self.kb.get_state()
-        was_connected = self._connected
-
-        if state == Keyboard.DEVICE_CONNECTED:
-            self._connected = True
-            self._reset_activity()
-    
-            machine.freq(CPU_FREQ_ACTIVE)
-            self.set_led(COLOR_GREEN)
-            log("BLE: Connected!")
-        elif state == Keyboard.DEVICE_IDLE:
+        handler = self._state_handlers.get(self.kb.get_state())
+        if handler:
+            handler(self._connected)
+
+    def _on_connected(self, was_connected):
+        self._connected = True
+        self._reset_activity()
+        machine.freq(CPU_FREQ_ACTIVE)
+        self.set_led(COLOR_GREEN)
+        log("BLE: Connected!")
+
+    def _on_idle(self, was_connected):
+        self._connected = False
+        if was_connected:
+            if not self.kb._was_encrypted and len(self.kb.secrets.secrets) > 1:
+                self._failed_connects += 1
+                log(f"BLE: Connect without encryption (fail #{self._failed_connects})")
+                if self._failed_connects >= 3:
+                    log("BLE: Auto-clearing stale bonds after 3 failed connects")
+                    self._clear_all_bonds(self.kb)
+                    time.sleep_ms(500)
+                    machine.reset()
+            else:
+                self._failed_connects = 0
+            log("BLE: Connection lost, restarting advertising")
+            machine.freq(CPU_FREQ_IDLE)
+            self.set_led(COLOR_BLUE)
+            if self._ble_ready:
+                try:
+                    self.kb.start_fast_advertising()
+                except Exception as e:
+                    log(f"BLE: Failed to start advertising: {e}")
+
+    def _on_advertising(self, was_connected):
+        if was_connected:
             self._connected = False
-            if was_connected:
-                if not self.kb._was_encrypted and len(self.kb.secrets.secrets) > 1:
-                    self._failed_connects += 1
-                    log(f"BLE: Connect without encryption (fail #{self._failed_connects})")
-                    if self._failed_connects >= 3:
-                        log("BLE: Auto-clearing stale bonds after 3 failed connects")
-                        self._clear_all_bonds(self.kb)
-                        time.sleep_ms(500)
-                        machine.reset()
-                else:
-                    self._failed_connects = 0
-                log("BLE: Connection lost, restarting advertising")
-                machine.freq(CPU_FREQ_IDLE)
-                self.set_led(COLOR_BLUE)
-                if self._ble_ready:
-                    try:
-                        self.kb.start_fast_advertising()
-                    except Exception as e:
-                        log(f"BLE: Failed to start advertising: {e}")
-        elif state == Keyboard.DEVICE_ADVERTISING:
-            if was_connected:
-                self._connected = False
-                log("BLE: Disconnected, advertising for reconnection")
-                machine.freq(CPU_FREQ_IDLE)
-                self.set_led(COLOR_BLUE)
+            log("BLE: Disconnected, advertising for reconnection")
+            machine.freq(CPU_FREQ_IDLE)
+            self.set_led(COLOR_BLUE)
 
     def _send_key(self, code, name="", btn_type=TYPE_KEY):
         """Send a key press."""
         if self._connected:
-            if btn_type == TYPE_CONSUMER:
-                self.kb.set_consumer(code)
-                self.kb.notify_consumer_report()
-                log(f"BLE key: {name} (Consumer 0x{code:02X})")
-            else:
-                self.kb.set_keys(code)
-                self.kb.notify_hid_report()
-                log(f"BLE key: {name} (Key 0x{code:02X})")
+            if self._press_pending:
+                self._flush_reports()
+            self._senders[btn_type](code)
+            self._press_pending = True
+            if _DEBUG:
+                log(f"BLE key: {name} ({_TYPE_LABELS[btn_type]} 0x{code:02X})")
             self._active_type = btn_type
             return True
         else:
@@ -714,82 +883,166 @@ class ShieldRemote:
     def _release_keys(self):
         """Release all keys."""
         if self._connected:
-            if self._active_type == TYPE_CONSUMER:
-                self.kb.set_consumer(0)
-                self.kb.notify_consumer_report()
-            else:
-                self.kb.set_keys()
-                self.kb.notify_hid_report()
-            self._active_type = None
-
-    def _handle_ble_buttons(self):
-        """Handle BLE HID button inputs."""
-        now = time.ticks_ms()
-
-        # Debounce check
-        if time.ticks_diff(now, self._last_press_time) < self._debounce_ms:
-            return
-
-        # Check each BLE button
-        for i, (btn, code, name, btn_type) in enumerate(self.ble_buttons):
-            state = btn.value()
-            if state != self.ble_button_states[i]:
-                self._last_press_time = now
-                self.ble_button_states[i] = state
-                if state == 0:  # Pressed (active LOW)
-                    self.set_led(COLOR_WHITE)
-                    self._send_key(code, name, btn_type)
-                    self._any_pressed = True
-                    self._reset_activity(from_button=True)
-                else:  # Released
-                    self._release_keys()
-
-        # Check if any BLE button is currently pressed
-        any_ble_pressed = any(btn.value() == 0 for btn, _, _, _ in self.ble_buttons)
-
-        any_ha_pressed = any(btn.value() == 0 for btn, _, _ in self.ha_buttons)
-
-        # Check power button
-        power_pressed = self._power_btn.value() == 0
-
-        # Reset LED if no buttons pressed
-        if not (any_ble_pressed or any_ha_pressed or power_pressed) and self._any_pressed:
+            if self._press_pending:
+                self._flush_reports()
+            self._releasers[self._active_type]()
+            self._active_type = TYPE_KEY
+
+    def _send_kb(self, code):
+        self.kb.set_keys(code)
+        self._kb_dirty = True
+
+    def _send_cc(self, code):
+        self.kb.set_consumer(code)
+        self._consumer_dirty = True
+
+    def _release_kb(self):
+        self.kb.set_keys()
+        self._kb_dirty = True
+
+    def _release_cc(self):
+        self.kb.set_consumer(0)
+        self._consumer_dirty = True
+
+    def _flush_reports(self):
+        """Notify each HID report changed since the last flush.
+
+        Edges in one scan are applied in button-index order, not time
+        order, so a staged press is flushed before any later edge can
+        overwrite it (see _send_key/_release_keys). What still coalesces
+        is releases: several buttons let go in one scan send one report.
+        """
+        self._press_pending = False
+        if self._consumer_dirty:
+            self._consumer_dirty = False
+            self.kb.notify_consumer_report()
+        if self._kb_dirty:
+            self._kb_dirty = False
+            self.kb.notify_hid_report()
+
+    def _handle_ble_buttons(self, cur):
+        """Handle BLE HID button inputs, cur = BLE button levels."""
+        # XOR with the previous mask gives the buttons that changed, and
+        # only those are visited. Each button debounces independently, so
+        # one press never masks another.
+        changed = cur ^ self._ble_mask
+        if changed:
+            now = time.ticks_ms()
+            changed_at = self._ble_changed_at
+            i = 0
+            while changed:
+                if changed & 1 and not _debouncing(now, changed_at[i], self._debounce_ms):
+                    changed_at[i] = now
+                    self._ble_mask ^= 1 << i
+                    self._ble_edge(i, (cur >> i) & 1)
+                changed >>= 1
+                i += 1
+
+    def _ble_edge(self, i, level):
+        """Act on an accepted edge of BLE button i (level 0 = pressed)."""
+        if not level:  # Pressed (active LOW)
+            self.set_led(COLOR_WHITE)
+            self._send_key(self._ble_codes[i], self._ble_names[i], self._ble_types[i])
+            self._any_pressed = True
+            self._reset_activity(from_button=True)
+        else:  # Released
+            self._release_keys()
+
+    def _on_button_irq(self, pin):
+        self._btn_flag.set()
+
+    def _scan_buttons(self):
+        """Scan every button once. Returns True if a level is still unsettled."""
+        # One snapshot of the GPIO input registers serves both handlers
+        raw = _read_mask(self._gpios)
+        # A button's level is only taken once two consecutive samples agree,
+        # for all buttons at once: single-sample glitches never reach the
+        # handlers, disagreeing bits keep their previous level.
+        agree = ~(raw ^ self._raw_mask)
+        self._raw_mask = raw
+        cur = (raw & agree) | (self._stable_mask & ~agree)
+        self._stable_mask = cur
+        self._handle_ble_buttons(cur & self._ble_released)
+        self._handle_ha_buttons(cur >> self._n_ble)
+        self._handle_power_button()
+        # Reset LED once nothing is held, from the state the handlers above
+        # just recorded rather than reading any pin again
+        if (self._any_pressed and self._ble_mask == self._ble_released
+                and self._ha_mask == self._ha_released
+                and self._power_btn_state):
             self._any_pressed = False
             if self._connected:
                 self.set_led(COLOR_GREEN)
             else:
                 self.set_led(COLOR_BLUE)
+        self._flush_reports()
+        return raw != cur
+
+    async def _button_task(self):
+        """Scan buttons as soon as an edge IRQ fires.
+
+        The main loop still scans every LOOP_SLEEP_MS as a backstop for
+        edges that land inside the debounce window.
+        """
+        while True:
+            await self._btn_flag.wait()
+            try:
+                # The first sample after an edge never agrees with the one
+                # before it; re-sample shortly rather than wait for the tick
+                for _ in range(_SETTLE_SCANS):
+                    if not self._scan_buttons():
+                        break
+                    await asyncio.sleep_ms(_SETTLE_MS)
+            except Exception as e:
+                log(f"Button scan error: {type(e).__name__}: {e}")
 
     def test_buttons(self):
         """Interactive button test mode."""
         print("Button Test Mode - Everything Remote")
         print("Press each button to test. Ctrl+C to exit.")
-        print(f"BLE: {len(self.ble_buttons)}, HA: {len(self.ha_buttons)}")
+        print(f"BLE: {len(self._ble_pins)}, HA: {len(self._ha_pins)}")
         try:
-            while True:
-                # Test BLE buttons
-                for i, (btn, code, name, btn_type) in enumerate(self.ble_buttons):
-                    if btn.value() == 0:
-                        type_str = "Consumer" if btn_type == TYPE_CONSUMER else "Keyboard"
-                        print(f"BLE: {name} (0x{code:02X}, {type_str})")
-                        self.set_led(COLOR_WHITE)
-                        while btn.value() == 0:
-                            time.sleep_ms(10)
-                        self.set_led(COLOR_OFF)
-
-                # Test HA buttons
-                for i, (btn, action, name) in enumerate(self.ha_buttons):
-                    if btn.value() == 0:
-                        print(f"HA: {name} ({action})")
-                        self.set_led(COLOR_PURPLE)
-                        while btn.value() == 0:
-                            time.sleep_ms(10)
-                        self.set_led(COLOR_OFF)
-
-                time.sleep_ms(10)
+            asyncio.run(self._test_buttons())
         except KeyboardInterrupt:
             print("\nTest ended")
 
+    async def _test_buttons(self):
+        # Sleeps on the button edge IRQs instead of polling, so holding a
+        # button costs no wake-ups; each edge re-reads both masks.
+        ble_held = ha_held = 0
+        while True:
+            await self._btn_flag.wait()
+            await asyncio.sleep_ms(self._debounce_ms)  # Let the contacts settle
+
+            # Bits set in the masks are held buttons
+            cur = _read_mask(self._gpios)
+            ble = (cur & self._ble_released) ^ self._ble_released
+            ha = (cur >> self._n_ble) ^ self._ha_released
+            new_ble = ble & ~ble_held
+            new_ha = ha & ~ha_held
+            ble_held, ha_held = ble, ha
+
+            i = 0
+            while new_ble:
+                if new_ble & 1:
+                    type_str = "Consumer" if self._ble_types[i] == TYPE_CONSUMER else "Keyboard"
+                    print(f"BLE: {self._ble_names[i]} (0x{self._ble_codes[i]:02X}, {type_str})")
+                new_ble >>= 1
+                i += 1
+            i = 0
+            while new_ha:
+                if new_ha & 1:
+                    print(f"HA: {self._ha_names[i]} ({self._ha_actions[i]})")
+                new_ha >>= 1
+                i += 1
+
+            if ble:
+                self.set_led(COLOR_WHITE)
+            elif ha:
+                self.set_led(COLOR_PURPLE)
+            else:
+                self.set_led(COLOR_OFF)
+
     async def run(self):
         """Main loop — async. Button handlers stay synchronous; they enqueue
         to ha_client which is drained by an independent mqtt_as-backed task."""
@@ -823,6 +1076,7 @@ class ShieldRemote:
 
         # Deferred hardware init (MPU, buttons, battery ADC, wake pins)
         self._late_init()
+        self._btn_task = asyncio.create_task(self._button_task())
 
         # CPU back to idle clock now that the init work is done
         machine.freq(CPU_FREQ_IDLE)
@@ -834,6 +1088,8 @@ class ShieldRemote:
 
         # Enqueue boot/wake battery publish — delivered whenever the outbox drains.
         self._publish_battery_forced()
+        if self._battery_enabled:
+            self._batt_task = asyncio.create_task(self._battery_task())
 
         # Main loop
         log("Entering main loop")
@@ -841,19 +1097,17 @@ class ShieldRemote:
         while True:
             try:
                 self._log_ble_state()
-                self._handle_ble_buttons()
-                self._handle_ha_buttons()
-                self._handle_power_button()
-                self._check_forget_combo()
-                self._check_setup_combo()
-                self._update_battery()
+                self._scan_buttons()
+                # One timestamp serves every housekeeping check this tick
+                now = time.ticks_ms()
+                self._check_combos(now)
                 self._ensure_advertising()
 
                 # Motion detection resets idle timer (keeps device awake when held)
                 if mpu6050.is_initialized and mpu6050.check_motion():
                     self._reset_activity()
 
-                await self._check_idle_timeout()
+                await self._check_idle_timeout(now)
 
                 await asyncio.sleep_ms(LOOP_SLEEP_MS)
                 error_count = 0
@@ -889,6 +1143,8 @@ def main():
             led = NeoPixel(Pin(LED_PIN, Pin.OUT), 1)
         except Exception:
             pass
+    # Room for a traceback if a pin IRQ handler raises
+    micropython.alloc_emergency_exception_buf(100)
     # Load config before ShieldRemote() so __init__ sees user settings (e.g. battery_enabled)
     config.load()
     try:
@@ -911,8 +1167,7 @@ def main():
             pass
         sys.print_exception(e)
         if led:
-            led[0] = COLOR_RED
-            led.write()
+            _write_led(led, COLOR_RED)
         # Wait then restart
         time.sleep(5)
         machine.reset()
@@ -921,6 +1176,7 @@ def main():
 def test():
     """Run button test mode."""
     remote = ShieldRemote()
+    remote._late_init()  # Button tables are built here
     remote.test_buttons()
 
 
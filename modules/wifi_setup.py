@@ -1,14 +1,18 @@
 # WiFi Setup Portal for Something Remote
 # Captive portal using Microdot web framework
 
+import asyncio
 import network
 import socket
 import time
 from config import config, POWER_MODE_BLE, POWER_MODE_HA
-from microdot import Microdot, Response
+from microdot import Microdot, Request, Response
 
 app = Microdot()
 
+# The setup form is well under 1 KB; don't let a request buffer 16 KB
+Request.max_content_length = 2048
+
 # HTML template for setup page
 HTML_PAGE = """<!DOCTYPE html>
 <html>
@@ -70,7 +74,7 @@ HTML_PAGE = """<!DOCTYPE html>
 </html>
 """
 
-HTML_SUCCESS = """<!DOCTYPE html>
+HTML_SUCCESS = b"""<!DOCTYPE html>
 <html>
 <head>
     <meta name="viewport" content="width=device-width, initial-scale=1">
@@ -87,31 +91,100 @@ HTML_SUCCESS = """<!DOCTYPE html>
 </html>
 """
 
+HTML_ERROR = """<!DOCTYPE html>
+<html>
+<head>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Something Remote Setup</title>
+    <style>
+        body{{font-family:sans-serif;margin:20px;background:#1a1a2e;color:#eee;text-align:center;padding-top:50px}}
+        h1{{color:#f44}}
+        a{{color:#0af}}
+    </style>
+</head>
+<body>
+    <h1>Settings Not Saved</h1>
+    <p>{message}</p>
+    <p><a href="/">Back</a></p>
+</body>
+</html>
+"""
+
+# Text settings are stored with a 1-byte length in the config blob
+_MAX_FIELD_BYTES = 255
+_TEXT_FIELDS = ('wifi_ssid', 'wifi_password', 'mqtt_host', 'mqtt_user', 'mqtt_password')
+
+
+# Response headers shared by every request. Response copies them into its
+# own dict, so the module-level dicts are never mutated
+_HTML_HEADERS = {'Content-Type': 'text/html'}
+_REDIRECT_HEADERS = {'Location': 'http://192.168.4.1/'}
+
+# Rendered setup page, rebuilt only after the config changes
+_page = None
+
+
+def _render_page():
+    """Fill HTML_PAGE from the current config, encoded ready to send."""
+    c = config
+    power_mode = c.power_button_mode
+    return HTML_PAGE.format(
+        wifi_ssid=c.wifi_ssid,
+        wifi_password=c.wifi_password,
+        mqtt_host=c.mqtt_host,
+        mqtt_port=c.mqtt_port,
+        mqtt_user=c.mqtt_user,
+        mqtt_password=c.mqtt_password,
+        power_ha_checked='checked' if power_mode == POWER_MODE_HA else '',
+        power_ble_checked='checked' if power_mode == POWER_MODE_BLE else '',
+        battery_checked='checked' if c.battery_enabled else '',
+        wake_counter_checked='checked' if c.wake_counter_enabled else '',
+    ).encode()
+
 
 @app.route('/')
 async def index(request):
     """Main setup page."""
-    power_mode = config.power_button_mode
-    html = HTML_PAGE.format(
-        wifi_ssid=config.wifi_ssid,
-        wifi_password=config.wifi_password,
-        mqtt_host=config.mqtt_host,
-        mqtt_port=config.mqtt_port,
-        mqtt_user=config.mqtt_user,
-        mqtt_password=config.mqtt_password,
-        power_ha_checked='checked' if power_mode == POWER_MODE_HA else '',
-        power_ble_checked='checked' if power_mode == POWER_MODE_BLE else '',
-        battery_checked='checked' if config.battery_enabled else '',
-        wake_counter_checked='checked' if config.wake_counter_enabled else '',
-    )
-    return html, 200, {'Content-Type': 'text/html'}
+    global _page
+    if _page is None:
+        _page = _render_page()
+    return _page, 200, _HTML_HEADERS
+
+
+async def _restart_later():
+    await asyncio.sleep(3)
+    import machine
+    machine.reset()
+
+
+def _check_form(form):
+    """Return an error message if the form can't be stored, else None."""
+    try:
+        port = int(form.get('mqtt_port', 1883))
+    except ValueError:
+        port = 0
+    if not 0 < port <= 65535:
+        return "MQTT port must be a number from 1 to 65535."
+    for key in _TEXT_FIELDS:
+        if len(form.get(key, '').encode()) > _MAX_FIELD_BYTES:
+            return "%s is longer than %d bytes." % (key, _MAX_FIELD_BYTES)
+    return None
+
+
+def _error_page(message):
+    return HTML_ERROR.format(message=message).encode(), 400, _HTML_HEADERS
 
 
 @app.route('/save', methods=['POST'])
 async def save(request):
     """Save configuration."""
+    global _page
     form = request.form
 
+    error = _check_form(form)
+    if error:
+        return _error_page(error)
+
     config.wifi_ssid = form.get('wifi_ssid', '')
     config.wifi_password = form.get('wifi_password', '')
     config.mqtt_host = form.get('mqtt_host', '')
@@ -122,41 +195,26 @@ async def save(request):
     config.battery_enabled = bool(form.get('battery_enabled'))
     config.wake_counter_enabled = bool(form.get('wake_counter_enabled'))
     config.set_configured(True)
-    config.save()
+    saved = config.save()
+    _page = None
+    if not saved:
+        return _error_page("Could not write the settings to flash.")
 
     print("Config saved, restarting in 3s...")
 
-    # Schedule restart
-    import _thread
-    def restart():
-        time.sleep(3)
-        import machine
-        machine.reset()
-    _thread.start_new_thread(restart, ())
-
-    return HTML_SUCCESS, 200, {'Content-Type': 'text/html'}
-
-
-# Captive portal detection - redirect to main page
-@app.route('/generate_204')
-@app.route('/gen_204')
-@app.route('/hotspot-detect.html')
-@app.route('/connecttest.txt')
-@app.route('/ncsi.txt')
-@app.route('/redirect')
-@app.route('/success.txt')
-@app.route('/canonical.html')
-@app.route('/favicon.ico')
-async def captive_portal(request):
-    """Handle captive portal detection."""
-    return '', 302, {'Location': 'http://192.168.4.1/'}
-
-
-# Catch-all route
+    # Schedule restart once the success page has gone out
+    asyncio.create_task(_restart_later())
+
+    return HTML_SUCCESS, 200, _HTML_HEADERS
+
+
+# Captive portal detection (generate_204, hotspot-detect.html,
+# connecttest.txt, ncsi.txt, ...) and everything else: redirect to the
+# main page. One catch-all keeps the route table at three entries
 @app.route('/<path:path>')
 async def catch_all(request, path):
     """Redirect everything else to main page."""
-    return '', 302, {'Location': 'http://192.168.4.1/'}
+    return b'', 302, _REDIRECT_HEADERS
 
 
 class CaptivePortalDNS:
@@ -164,6 +222,16 @@ class CaptivePortalDNS:
 
     def __init__(self, ip="192.168.4.1"):
         self.ip = ip
+        # Answer RR (name pointer to the question, A, IN, TTL 60, 4-byte
+        # RDATA) and our address never change, so pack them once
+        self._answer = (b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04'
+                        + bytes(int(x) for x in ip.split('.')))
+        # Reply buffer reused for every query: a query is at most 512
+        # bytes and the reply only appends the answer. Flags and the
+        # Auth + Additional counts are the same every time
+        self._buf = bytearray(512 + len(self._answer))
+        self._mv = memoryview(self._buf)
+        self._buf[2:4] = b'\x81\x80'
         self.sock = None
         self._running = False
 
@@ -186,32 +254,49 @@ class CaptivePortalDNS:
             return
         try:
             data, addr = self.sock.recvfrom(512)
-            if len(data) < 12:
+            # Only answer standard queries (QR clear, opcode 0) asking a
+            # single question; anything else is dropped unanswered
+            if len(data) < 12 or data[2] & 0xF8 or data[4] or data[5] != 1:
                 return
 
-            # Build DNS response pointing to our IP
-            response = bytearray(data[:2])  # Transaction ID
-            response += b'\x81\x80'  # Flags
-            response += data[4:6]  # Questions
-            response += data[4:6]  # Answers
-            response += b'\x00\x00\x00\x00'  # Auth + Additional
-
-            # Copy question
-            pos = 12
-            while pos < len(data) and data[pos] != 0:
-                pos += data[pos] + 1
-            pos += 5
-            response += data[12:pos]
-
-            # Add answer
-            response += b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04'
-            response += bytes(map(int, self.ip.split('.')))
-
-            self.sock.sendto(response, addr)
-        except Exception:
+            # Find the end of the question (QNAME labels + QTYPE + QCLASS).
+            # Hostnames never contain a zero byte, so the first one after
+            # the header is the QNAME terminator
+            pos = data.find(b'\x00', 12) + 5
+            # No terminator, or the packet ends before QTYPE/QCLASS
+            if pos < 17 or pos > len(data):
+                return
+
+            # Build DNS response pointing to our IP: header, question, answer
+            mv = self._mv
+            end = pos + len(self._answer)
+            mv[0:2] = data[0:2]  # Transaction ID
+            mv[4:6] = data[4:6]  # Questions
+            mv[6:8] = data[4:6]  # Answers
+            mv[12:pos] = data[12:pos]
+            mv[pos:end] = self._answer
+
+            self.sock.sendto(mv[:end], addr)
+        except OSError:
+            # EAGAIN after a spurious wakeup, or the client went away
             pass
 
 
+async def _dns_task(dns):
+    """Answer DNS queries from the web server's event loop."""
+    # asyncio has no datagram streams, so park on the socket the same way
+    # its Stream.read does: the task only wakes when a query is waiting
+    queue_read = asyncio.core._io_queue.queue_read
+    while dns._running:
+        yield queue_read(dns.sock)
+        dns.poll()
+
+
+async def _serve(dns):
+    asyncio.create_task(_dns_task(dns))
+    await app.start_server(port=80)
+
+
 _dns = None
 
 def run_setup_portal(led_callback=None):
@@ -223,7 +308,8 @@ def run_setup_portal(led_callback=None):
     # Disable STA interface first (may interfere with AP)
     sta = network.WLAN(network.STA_IF)
     if sta.active():
-        sta.disconnect()
+        if sta.isconnected():
+            sta.disconnect()
         sta.active(False)
         print("STA disabled")
 
@@ -232,30 +318,25 @@ def run_setup_portal(led_callback=None):
     ap.active(True)
     ap.config(essid="SomethingRemote-Setup", password="12345678", authmode=network.AUTH_WPA_WPA2_PSK)
 
-    for _ in range(50):
+    # Start DNS before waiting on the AP so the first probe gets answered.
+    # Binding 0.0.0.0:53 doesn't need the interface up, and the AP always
+    # comes up on the default 192.168.4.1 the redirects point at
+    _dns = CaptivePortalDNS()
+    _dns.start()
+
+    # Usually up well within 100 ms; check often but keep the 5 s ceiling
+    for _ in range(250):
         if ap.active():
             break
-        time.sleep_ms(100)
+        time.sleep_ms(20)
 
     ip = ap.ifconfig()[0]
     print(f"AP: SomethingRemote-Setup (pw: 12345678)")
     print(f"Go to http://{ip}")
 
-    # Start DNS
-    _dns = CaptivePortalDNS(ip)
-    _dns.start()
-
-    # Run DNS in background thread
-    import _thread
-    def dns_loop():
-        while _dns and _dns._running:
-            _dns.poll()
-            time.sleep_ms(10)
-    _thread.start_new_thread(dns_loop, ())
-
-    # Run Microdot (blocking)
+    # Run Microdot with DNS alongside it on the same event loop (blocking)
     try:
-        app.run(port=80)
+        asyncio.run(_serve(_dns))
     finally:
         if _dns:
             _dns.stop()